@@ -0,0 +1,141 @@
+from __future__ import annotations
+
+import math
+from typing import Iterable, List
+
+try:
+    import numpy as _np  # type: ignore
+except Exception:
+    _np = None
+
+_MASK64 = (1 << 64) - 1
+
+
+def _np_words(blob: bytes):
+    """First two big-endian 64-bit words of each 20-byte digest in a joined blob, as uint64 arrays."""
+    words = _np.frombuffer(blob, dtype=_np.uint8).reshape(-1, 20)[:, :16].copy().view('>u8')
+    return words[:, 0].astype(_np.uint64), words[:, 1].astype(_np.uint64)
+
+
+class BloomFilter:
+    """Fixed-size Bloom filter over 20-byte SHA-1 digests.
+
+    A miss is definitive, a hit only means "maybe", so it is meant as a cheap
+    prefilter in front of an exact set. The digests are already uniformly
+    distributed, so the k bit positions come straight from their first two
+    64-bit words via Kirsch-Mitzenmacher double hashing: h1 + i*h2 (mod 2**64, then mod m).
+    """
+
+    __slots__ = ('m', 'k', 'bits')
+
+    def __init__(self, capacity: int, error_rate: float = 0.01) -> None:
+        n = max(1, int(capacity))
+        # m ~= 1.44 * log2(1/p) * n bits, k = (m/n) ln 2
+        m = int(math.ceil(-n * math.log(error_rate) / (math.log(2) ** 2)))
+        self.m = max(64, m)
+        self.k = max(1, int(round(self.m / n * math.log(2))))
+        self.bits = bytearray((self.m + 7) // 8)
+
+    def _positions(self, digest: bytes):
+        h1 = int.from_bytes(digest[:8], 'big')
+        h2 = int.from_bytes(digest[8:16], 'big')
+        m = self.m
+        return [((h1 + i * h2) & _MASK64) % m for i in range(self.k)]
+
+    def add(self, digest: bytes) -> None:
+        bits = self.bits
+        for p in self._positions(digest):
+            bits[p >> 3] |= 1 << (p & 7)
+
+    def update(self, digests: Iterable[bytes]) -> None:
+        if _np is None:
+            for d in digests:
+                self.add(d)
+            return
+        blob = b''.join(digests)
+        if not blob:
+            return
+        # Vectorized: all k positions of every digest at once, then OR the packed bits in
+        h1, h2 = _np_words(blob)
+        m = _np.uint64(self.m)
+        mask = _np.zeros(self.m, dtype=bool)
+        for i in range(self.k):
+            mask[(h1 + _np.uint64(i) * h2) % m] = True
+        bits = _np.frombuffer(self.bits, dtype=_np.uint8)
+        bits |= _np.packbits(mask, bitorder='little')
+
+    def contains_many(self, digests: List[bytes]) -> List[bool]:
+        """Membership of a batch of digests, vectorized when NumPy is available."""
+        if _np is None or len(digests) < 64:
+            return [d in self for d in digests]
+        h1, h2 = _np_words(b''.join(digests))
+        m = _np.uint64(self.m)
+        bits = _np.frombuffer(bytes(self.bits), dtype=_np.uint8)
+        hit = _np.ones(len(digests), dtype=bool)
+        for i in range(self.k):
+            p = (h1 + _np.uint64(i) * h2) % m
+            hit &= ((bits[p >> _np.uint64(3)] >> (p & _np.uint64(7)).astype(_np.uint8)) & 1).astype(bool)
+        return hit.tolist()
+
+    def __contains__(self, digest: bytes) -> bool:
+        bits = self.bits
+        for p in self._positions(digest):
+            if not (bits[p >> 3] >> (p & 7)) & 1:
+                return False
+        return True
+
+
+class ScalableBloomFilter:
+    """Bloom filter that grows instead of saturating (Almeida et al.'s scalable variant).
+
+    When the newest slice reaches its capacity a new one is added with `growth`
+    times the capacity and `tightening` times the error rate, which bounds the
+    compound false-positive rate by `error_rate`.
+    """
+
+    __slots__ = ('initial_capacity', 'error_rate', 'growth', 'tightening', 'filters', '_capacity', '_fill')
+
+    def __init__(self, initial_capacity: int = 1_000_000, error_rate: float = 1e-6,
+                 growth: int = 2, tightening: float = 0.5) -> None:
+        self.initial_capacity = max(1, int(initial_capacity))
+        self.error_rate = error_rate
+        self.growth = growth
+        self.tightening = tightening
+        self.filters: List[BloomFilter] = []
+        self._grow()
+
+    def _grow(self) -> None:
+        i = len(self.filters)
+        self._capacity = self.initial_capacity * self.growth ** i
+        # Geometric series: sum of all slice rates stays <= error_rate
+        rate = self.error_rate * (1 - self.tightening) * self.tightening ** i
+        self.filters.append(BloomFilter(self._capacity, rate))
+        self._fill = 0
+
+    def add(self, digest: bytes) -> None:
+        if self._fill >= self._capacity:
+            self._grow()
+        self.filters[-1].add(digest)
+        self._fill += 1
+
+    def update(self, digests: Iterable[bytes]) -> None:
+        digests = digests if isinstance(digests, list) else list(digests)
+        i = 0
+        while i < len(digests):
+            room = self._capacity - self._fill
+            if room <= 0:
+                self._grow()
+                continue
+            chunk = digests[i:i + room]
+            self.filters[-1].update(chunk)
+            self._fill += len(chunk)
+            i += len(chunk)
+
+    def contains_many(self, digests: List[bytes]) -> List[bool]:
+        hits = self.filters[0].contains_many(digests)
+        for f in self.filters[1:]:
+            hits = [a or b for a, b in zip(hits, f.contains_many(digests))]
+        return hits
+
+    def __contains__(self, digest: bytes) -> bool:
+        return any(digest in f for f in self.filters)
@@ -1,6 +1,6 @@
 from __future__ import annotations
 import os
-import base64
+import binascii
 import hashlib
 import threading
 
@@ -26,22 +26,48 @@ def log(msg: str) -> None:
         print(msg, flush=True)
 
 
+def _io_workers(n_items: int, limit: int | None = None) -> int:
+    """Threads for n_items I/O-bound tasks: never more than there are tasks, at most `limit`
+    (default max(32, 8 per CPU), as for the stdlib's default executor sizing)."""
+    if limit is None:
+        limit = max(32, (os.cpu_count() or 1) * 8)
+    return max(1, min(int(n_items), int(limit)))
+
+
 def sha1_hex(s: str) -> str:
     return hashlib.sha1(s.encode('utf-8', errors='ignore')).hexdigest()
 
 
-def safe_b64decode_to_bytes(s: str) -> bytes | None:
+def sha1_bytes(s: str) -> bytes:
+    """Raw 20-byte SHA-1 digest; half the size of the hex form and what tested storage keeps."""
+    return hashlib.sha1(s.encode('utf-8', errors='ignore')).digest()
+
+
+# One C-level pass: URL-safe alphabet to standard, ASCII whitespace (the part of what
+# str.split() drops that can occur in ASCII text) removed
+_B64_URLSAFE = bytes.maketrans(b'-_', b'+/')
+_B64_WHITESPACE = b' \t\n\r\x0b\x0c\x1c\x1d\x1e\x1f'
+
+
+def safe_b64decode_to_bytes(s: str | bytes) -> bytes | None:
     """Try to base64-decode a string with leniency (padding, URL-safe). Returns None on failure."""
     if not s:
         return None
-    # Remove whitespace
-    compact = ''.join(s.split())
-    # Convert URL-safe variants
-    compact = compact.replace('-', '+').replace('_', '/')
+    try:
+        data = s.encode('ascii') if isinstance(s, str) else bytes(s)
+    except UnicodeEncodeError:
+        # Non-ASCII whitespace (NBSP, U+2028, U+3000, ...) is dropped like the rest;
+        # anything else non-ASCII still fails the encode and is not base64
+        try:
+            data = ''.join(s.split()).encode('ascii')
+        except UnicodeEncodeError:
+            return None
+    compact = data.translate(_B64_URLSAFE, _B64_WHITESPACE)
     # Pad
     padding = (-len(compact)) % 4
-    compact += '=' * padding
+    if padding:
+        compact += b'=' * padding
     try:
-        return base64.b64decode(compact, validate=False)
+        return binascii.a2b_base64(compact)
     except Exception:
         return None
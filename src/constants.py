@@ -1,9 +1,10 @@
+import functools
 import os
 import sys
 import shutil
-import multiprocessing
+import statistics
 import time
-from typing import Optional, List, Tuple
+from typing import Dict, Optional, List, Tuple
 from concurrent.futures import ThreadPoolExecutor, as_completed
 
 # Determine repository root as parent of this src directory
@@ -17,6 +18,7 @@ AVAILABLE_FILE = os.path.join(OUTPUT_DIR, 'all_valid_proxies.txt')
 STREAKS_FILE = os.path.join(STATE_DIR, 'streaks.json')
 KIND_DIR = os.path.join(OUTPUT_DIR, 'kind')
 COUNTRY_DIR = os.path.join(OUTPUT_DIR, 'country')
+GROUPED_RUNS_FILE = os.path.join(STATE_DIR, 'grouped_runs.txt')  # incremental grouped-output runs since the last full rewrite
 
 
 def _env_int(name: str, default: int, min_v: Optional[int] = None, max_v: Optional[int] = None) -> int:
@@ -34,26 +36,31 @@ def _env_int(name: str, default: int, min_v: Optional[int] = None, max_v: Option
     return n
 
 
+_CI_VARS = frozenset((
+    'CI', 'GITHUB_ACTIONS', 'GITLAB_CI', 'BUILD_ID', 'BUILD_NUMBER', 'TF_BUILD',
+    'CIRCLECI', 'TRAVIS', 'APPVEYOR', 'JENKINS_URL', 'TEAMCITY_VERSION',
+    'BITBUCKET_BUILD_NUMBER', 'DRONE', 'WOODPECKER', 'BUILDKITE'
+))
+
+
 def _is_ci_env() -> bool:
     """Detect common CI environments beyond just GitHub Actions.
 
     Recognizes a broad set of CI-specific environment indicators.
     """
     try:
-        ci_vars = (
-            'CI', 'GITHUB_ACTIONS', 'GITLAB_CI', 'BUILD_ID', 'BUILD_NUMBER', 'TF_BUILD',
-            'CIRCLECI', 'TRAVIS', 'APPVEYOR', 'JENKINS_URL', 'TEAMCITY_VERSION',
-            'BITBUCKET_BUILD_NUMBER', 'DRONE', 'WOODPECKER', 'BUILDKITE'
-        )
-        for k in ci_vars:
-            v = os.environ.get(k)
-            if isinstance(v, str) and v.strip():
-                # Some providers set explicit boolean-like strings
-                if v.strip().lower() in ('1', 'true', 'yes', 'on'):
-                    return True
-                # Others just set a non-empty marker (e.g., Jenkins URL)
-                if k not in ('CI',):  # 'CI' is often set to 'true' specifically
-                    return True
+        env = os.environ
+        # Only inspect the CI markers that are actually set
+        for k in _CI_VARS & env.keys():
+            v = env[k].strip()
+            if not v:
+                continue
+            # Some providers set explicit boolean-like strings
+            if v.lower() in ('1', 'true', 'yes', 'on'):
+                return True
+            # Others just set a non-empty marker (e.g., Jenkins URL)
+            if k != 'CI':  # 'CI' is often set to 'true' specifically
+                return True
         return False
     except Exception:
         return False
@@ -81,22 +88,62 @@ def _get_sources_file() -> str:
 SOURCES_FILE = _get_sources_file()
 
 
-def _get_system_specs():
-    """Get system CPU cores and available memory."""
+def _total_memory_gb() -> Optional[float]:
+    """Total physical memory in GB without third-party deps; None if it cannot be determined."""
+    # Linux: a single read of /proc/meminfo
     try:
-        cpu_cores = multiprocessing.cpu_count()
+        with open('/proc/meminfo', 'r', encoding='ascii', errors='ignore') as f:
+            for line in f:
+                if line.startswith('MemTotal:'):
+                    return int(line.split()[1]) / (1024 ** 2)  # kB -> GB
     except Exception:
-        cpu_cores = 2  # fallback
+        pass
+    # Other POSIX (macOS/BSD)
+    try:
+        return os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES') / (1024 ** 3)
+    except Exception:
+        pass
+    # Windows
+    try:
+        import ctypes
+
+        class _MemoryStatusEx(ctypes.Structure):
+            _fields_ = [
+                ('dwLength', ctypes.c_ulong),
+                ('dwMemoryLoad', ctypes.c_ulong),
+                ('ullTotalPhys', ctypes.c_ulonglong),
+                ('ullAvailPhys', ctypes.c_ulonglong),
+                ('ullTotalPageFile', ctypes.c_ulonglong),
+                ('ullAvailPageFile', ctypes.c_ulonglong),
+                ('ullTotalVirtual', ctypes.c_ulonglong),
+                ('ullAvailVirtual', ctypes.c_ulonglong),
+                ('ullAvailExtendedVirtual', ctypes.c_ulonglong),
+            ]
 
+        stat = _MemoryStatusEx()
+        stat.dwLength = ctypes.sizeof(_MemoryStatusEx)
+        if ctypes.windll.kernel32.GlobalMemoryStatusEx(ctypes.byref(stat)):
+            return stat.ullTotalPhys / (1024 ** 3)
+    except Exception:
+        pass
+    return None
+
+
+@functools.lru_cache(maxsize=1)
+def _get_system_specs() -> Tuple[int, float]:
+    """Get system CPU cores and available memory (probed once per process)."""
     try:
-        # Get available memory in GB
-        import psutil
-        memory_gb = psutil.virtual_memory().total / (1024 ** 3)
-    except ImportError:
-        # Fallback without psutil - estimate based on common CI environments
-        memory_gb = 16 if _is_ci_env() else 8
+        # Respect the CPU affinity mask (container/cgroup limits) where supported
+        cpu_cores = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cpu_cores = os.cpu_count() or 2
     except Exception:
-        memory_gb = 8  # conservative fallback
+        cpu_cores = 2  # fallback
+
+    memory_gb = _total_memory_gb()
+    if memory_gb is None:
+        # Unknown platform - estimate based on common CI environments
+        memory_gb = 16 if _is_ci_env() else 8
 
     return cpu_cores, memory_gb
 
@@ -142,7 +189,7 @@ def _benchmark_worker_pool(worker_counts: List[int], test_duration: float = 2.0)
         results = []
         
         for worker_count in worker_counts:
-            start_time = time.time()
+            start_time = time.perf_counter()
             
             # Test pool creation and basic task execution
             with ThreadPoolExecutor(max_workers=worker_count) as pool:
@@ -156,7 +203,7 @@ def _benchmark_worker_pool(worker_counts: List[int], test_duration: float = 2.0)
                     except Exception:
                         pass
             
-            end_time = time.time()
+            end_time = time.perf_counter()
             overhead = end_time - start_time
             
             # Score: lower overhead is better, but we want some workers
@@ -178,39 +225,34 @@ def _benchmark_worker_pool(worker_counts: List[int], test_duration: float = 2.0)
         # Fallback to heuristic if benchmarking fails
         return _adaptive_workers(16, 128, 32), 1.0
 
+
+def _search_worker_count(cpu_cores: int, min_workers: int) -> int:
+    """Sample cpu*{1,2,4,8} workers, then probe +/-25% around the best score."""
+    coarse = sorted({max(min_workers, cpu_cores * m) for m in (1, 2, 4, 8)})
+    best = _benchmark_worker_pool(coarse)[0]
+    fine = sorted({max(min_workers, int(best * 0.75)), best, max(min_workers, int(best * 1.25))})
+    return _benchmark_worker_pool(fine)[0]
+
+
 def _discover_optimal_workers() -> Tuple[int, int]:
     """Automatically discover optimal worker counts for current environment."""
+    # CI runners share hosts with other jobs, so a benchmark there measures noisy
+    # neighbours rather than the workload; use a fixed, vetted pair instead.
+    if _is_ci_env():
+        return 16, 64
+
     try:
         cpu_cores, memory_gb = _get_system_specs()
         
-        # Test different worker ranges based on system specs - MAXIMUM PERFORMANCE
-        if _is_ci_env():
-            # CI environments: test maximum ranges
-            test_ranges = [
-                list(range(24, 73, 8)),      # 24, 32, 40, 48, 56, 64, 72
-                list(range(48, 145, 16)),    # 48, 64, 80, 96, 112, 128, 144
-                list(range(96, 257, 32)),    # 96, 128, 160, 192, 224, 256
-            ]
+        # Coarse-to-fine search sized to the machine - MAXIMUM PERFORMANCE
+        if cpu_cores >= 8:
+            # High-end systems: maximum performance floors
+            optimal_fetch = _search_worker_count(cpu_cores, 16)
+            optimal_ping = _search_worker_count(cpu_cores, 32)
         else:
-            # Local environments: test aggressive performance ranges
-            if cpu_cores >= 8:
-                # High-end systems: maximum performance ranges
-                test_ranges = [
-                    list(range(16, cpu_cores * 4 + 1, 4)),    # 16, 20, 24, 28, 32, 36, 40, 44, 48
-                    list(range(32, cpu_cores * 6 + 1, 8)),    # 32, 40, 48, 56, 64, 72
-                    list(range(64, cpu_cores * 8 + 1, 16)),   # 64, 80, 96, 112, 128
-                ]
-            else:
-                # Standard systems: aggressive ranges
-                test_ranges = [
-                    list(range(12, 41, 4)),   # 12, 16, 20, 24, 28, 32, 36, 40
-                    list(range(24, 81, 8)),   # 24, 32, 40, 48, 56, 64, 72, 80
-                    list(range(48, 145, 16)), # 48, 64, 80, 96, 112, 128, 144
-                ]
-        
-        # Find optimal for each type
-        optimal_fetch = _benchmark_worker_pool(test_ranges[0])[0]
-        optimal_ping = _benchmark_worker_pool(test_ranges[1])[0]
+            # Standard systems: aggressive floors
+            optimal_fetch = _search_worker_count(cpu_cores, 12)
+            optimal_ping = _search_worker_count(cpu_cores, 24)
         
         # Apply memory constraints - more aggressive for performance
         if cpu_cores >= 8 and memory_gb >= 16:
@@ -238,31 +280,38 @@ def _discover_optimal_workers() -> Tuple[int, int]:
         else:
             return _adaptive_workers(12, 96, 16), _adaptive_workers(24, 192, 32)
 
+
+_DNS_PROBE_SERVER = ('1.1.1.1', 53)
+_DNS_PROBE_QUERY = b'\x01\x00\x00\x01\x00\x00\x00\x00\x00\x00\x01a\x00\x00\x01\x00\x01'
+
+
 def _discover_optimal_timeouts() -> Tuple[int, int, int]:
     """Automatically discover optimal timeout values for current environment."""
     try:
         cpu_cores, memory_gb = _get_system_specs()
         
-        # Test network responsiveness
-        test_hosts = ['1.1.1.1', '8.8.8.8', '208.67.222.222']
+        # Test network responsiveness with a single-RTT UDP DNS query (no TCP handshake)
+        import socket
         timeouts = []
-        
-        for host in test_hosts:
-            try:
-                import socket
-                start = time.time()
-                sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-                sock.settimeout(5.0)
-                sock.connect((host, 443))
-                sock.close()
-                response_time = (time.time() - start) * 1000  # Convert to ms
-                timeouts.append(response_time)
-            except Exception:
-                timeouts.append(1000)  # Default 1 second
-        
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+            sock.settimeout(1.0)
+            for i in range(1, 4):
+                # Minimal DNS query: header (id=i, RD, QDCOUNT=1) + "a." IN A
+                query = bytes((0, i)) + _DNS_PROBE_QUERY
+                try:
+                    start = time.perf_counter()
+                    sock.sendto(query, _DNS_PROBE_SERVER)
+                    while True:
+                        data, _ = sock.recvfrom(512)
+                        if data[:2] == query[:2]:
+                            break
+                    timeouts.append((time.perf_counter() - start) * 1000)  # Convert to ms
+                except Exception:
+                    timeouts.append(1000)  # Default 1 second
+
         # Calculate optimal timeouts based on network performance
-        avg_response = sum(timeouts) / len(timeouts) if timeouts else 1000
-        
+        avg_response = statistics.median(timeouts) if timeouts else 1000
+
         # Base timeouts with network adaptation - MAXIMUM PERFORMANCE
         if avg_response < 50:  # Very fast network (<50ms)
             ping_timeout = max(300, min(800, int(avg_response * 4)))
@@ -287,6 +336,32 @@ def _discover_optimal_timeouts() -> Tuple[int, int, int]:
         # Fallback to aggressive timeouts for maximum performance
         return _adaptive_timeout(800, True), _adaptive_timeout(1200, True), _adaptive_timeout(1000, True)
 
+def _adaptive_stage3_workers() -> int:
+    """Calculate optimal Stage 3 worker count (V2Ray core validation) - MAXIMUM PERFORMANCE."""
+    # In CI environments, keep this modest to avoid OOM and process thrash
+    if _is_ci_env():
+        return _env_int('OPENRAY_STAGE3_WORKERS_CI', 16, 4, 32)
+
+    cpu_cores, memory_gb = _get_system_specs()
+
+    # Stage 3 is CPU+memory intensive (spawning V2Ray processes)
+    # Aggressive approach for maximum performance
+    if cpu_cores >= 8:
+        base_workers = cpu_cores * 3  # 3x cores for high-end systems
+        memory_per_process = 65  # More aggressive memory estimate
+    else:
+        base_workers = cpu_cores * 2  # 2x cores for standard systems
+        memory_per_process = 75  # Balanced memory estimate
+
+    # Memory constraint: V2Ray processes use ~65-100MB each
+    max_by_memory = int(memory_gb * 1024 / memory_per_process)
+
+    # Apply reasonable bounds
+    workers = min(base_workers, max_by_memory)
+
+    return max(8, min(workers, 128))  # Range: 8-128 workers (increased for performance)
+
+
 # Tuning (overridable by environment)
 # Auto-discovered optimal parameters with fallbacks
 _CI = _is_ci_env()
@@ -303,68 +378,111 @@ except Exception as e:
     _opt_fetch, _opt_ping = _adaptive_workers(8 if _CI else 6, 96 if _CI else 64, 16 if _CI else 8), _adaptive_workers(24 if _CI else 16, 192 if _CI else 256, 48 if _CI else 32)
     _opt_ping_timeout, _opt_connect_timeout, _opt_probe_timeout = _adaptive_timeout(1000, True), _adaptive_timeout(1500, True), _adaptive_timeout(1200, True)
 
-# Timeouts (optimized for speed - reduced for faster failure detection)
-FETCH_TIMEOUT = _env_int('OPENRAY_FETCH_TIMEOUT',
-                        _adaptive_timeout(15000, True) // 1000, 1, 120)
-PING_TIMEOUT_MS = _env_int('OPENRAY_PING_TIMEOUT_MS',
-                          min(_opt_ping_timeout, 350), 50, 10000)
-
-# Workers (maximum performance with safety limits)
-FETCH_WORKERS = _env_int('OPENRAY_FETCH_WORKERS', max(_opt_fetch, 16), 1, 512)
-PING_WORKERS = _env_int('OPENRAY_PING_WORKERS', max(_opt_ping, 32), 1, 2048)
+def _parse_env_schema(schema: Dict[str, Tuple[int, int, int]]) -> Dict[str, int]:
+    """Resolve every ``name -> (default, min, max)`` entry against the environment in one pass.
 
-# TCP connect timeout for checking specific proxy ports (ms) - maximum performance
-CONNECT_TIMEOUT_MS = _env_int('OPENRAY_CONNECT_TIMEOUT_MS',
-                             min(_opt_connect_timeout, 500), 50, 10000)
+    Unset or non-integer values fall back to the default; explicit values are clamped.
+    """
+    env = os.environ
+    cfg: Dict[str, int] = {}
+    for name, (default, min_v, max_v) in schema.items():
+        val = env.get(name)
+        if val is None:
+            cfg[name] = default
+            continue
+        try:
+            n = int(val)
+        except ValueError:
+            cfg[name] = default
+            continue
+        cfg[name] = max(min_v, min(n, max_v))
+    return cfg
+
+
+# Environment overrides: name -> (default, min, max)
+_SCHEMA: Dict[str, Tuple[int, int, int]] = {
+    # Timeouts (optimized for speed - reduced for faster failure detection)
+    'OPENRAY_FETCH_TIMEOUT': (_adaptive_timeout(15000, True) // 1000, 1, 120),
+    'OPENRAY_PING_TIMEOUT_MS': (min(_opt_ping_timeout, 350), 50, 10000),
+    # Workers (maximum performance with safety limits)
+    'OPENRAY_FETCH_WORKERS': (max(_opt_fetch, 16), 1, 512),
+    'OPENRAY_PING_WORKERS': (max(_opt_ping, 32), 1, 2048),
+    # TCP connect timeout for checking specific proxy ports (ms) - maximum performance
+    'OPENRAY_CONNECT_TIMEOUT_MS': (min(_opt_connect_timeout, 500), 50, 10000),
+    # Stage 2/3 controls
+    'OPENRAY_ENABLE_STAGE2': (1, 0, 1),  # 1=enable TLS probe after TCP
+    # 1=run Stage 2 connect/probe on one asyncio loop instead of a thread per check
+    'OPENRAY_ASYNC_STAGE2': (0, 0, 1),
+    'OPENRAY_ASYNC_STAGE2_CONCURRENCY': (2000, 1, 20000),
+    'OPENRAY_PROBE_TIMEOUT_MS': (min(_opt_probe_timeout, 450), 50, 10000),
+    'OPENRAY_ENABLE_STAGE3': (1, 0, 1),  # default enable
+    # Validate up to many proxies with core by default (can be reduced via env)
+    'OPENRAY_STAGE3_MAX': (5000, 1, 100000),
+    # Stage 3 adaptive workers (maximum performance)
+    'OPENRAY_STAGE3_WORKERS': (max(_adaptive_stage3_workers(), 24), 4, 512),
+    # URIs served by one core process (one HTTP inbound each); 1 = a process per URI
+    'OPENRAY_STAGE3_BATCH': (16, 1, 256),
+    # Limit for number of new URIs processed per run
+    'OPENRAY_NEW_URIS_LIMIT_ENABLED': (1, 0, 1),
+    'OPENRAY_NEW_URIS_LIMIT': (25000, 1, 1000000),
+    # Streak selection parameters
+    'OPENRAY_STREAK_REQUIRED': (5, 1, 100),
+    # Grouped outputs: append-only runs between full kind/country rewrites (0 = always rewrite)
+    'OPENRAY_GROUPED_FULL_EVERY': (10, 0, 1000),
+    # Seconds a cached DNS answer is reused (stale answers still serve resolver failures)
+    'OPENRAY_DNS_CACHE_TTL': (900, 0, 86400),
+    # Seconds allowed for the IP-only Internet connectivity probes
+    'OPENRAY_CONNECTIVITY_TIMEOUT': (5, 1, 60),
+    # Stage 2 TCP connects started per second across all workers (0 = unpaced)
+    'OPENRAY_PROBE_RATE': (1000, 0, 1000000),
+    # 1 = also write an indented check_counts.json.pretty copy for inspection
+    'OPENRAY_PRETTY_CHECK_COUNTS': (0, 0, 1),
+    # Existing-only revalidation trusts hosts with this success streak (0 = off) and a success
+    # within the window (seconds), re-checking a sampled percentage of them anyway
+    'OPENRAY_TRUST_STREAK': (10, 0, 1000),
+    'OPENRAY_TRUST_WINDOW': (3600, 0, 604800),
+    'OPENRAY_TRUST_SAMPLE_PCT': (10, 0, 100),
+}
+CFG: Dict[str, int] = _parse_env_schema(_SCHEMA)
+
+FETCH_TIMEOUT = CFG['OPENRAY_FETCH_TIMEOUT']
+PING_TIMEOUT_MS = CFG['OPENRAY_PING_TIMEOUT_MS']
+
+FETCH_WORKERS = CFG['OPENRAY_FETCH_WORKERS']
+PING_WORKERS = CFG['OPENRAY_PING_WORKERS']
+
+CONNECT_TIMEOUT_MS = CFG['OPENRAY_CONNECT_TIMEOUT_MS']
 # Ports to try for TCP connectivity fallback (when ICMP ping is blocked, e.g., in CI)
-TCP_FALLBACK_PORTS: List[int] = [80, 443, 8080, 8443, 2052, 2082, 2086, 2095]
-USER_AGENT = (
+TCP_FALLBACK_PORTS: Tuple[int, ...] = (80, 443, 8080, 8443, 2052, 2082, 2086, 2095)
+USER_AGENT = sys.intern(
     'Mozilla/5.0 (Windows NT 10.0; Win64; x64) '
     'AppleWebKit/537.36 (KHTML, like Gecko) '
     'Chrome/122.0 Safari/537.36'
 )
 
 # Stage 2/3 controls (overridable by environment)
-ENABLE_STAGE2 = _env_int('OPENRAY_ENABLE_STAGE2', 1, 0, 1)  # 1=enable TLS probe after TCP
-PROBE_TIMEOUT_MS = _env_int('OPENRAY_PROBE_TIMEOUT_MS', min(_opt_probe_timeout, 450), 50, 10000)
-ENABLE_STAGE3 = _env_int('OPENRAY_ENABLE_STAGE3', 1, 0, 1)  # default enable
-# Validate up to many proxies with core by default (can be reduced via env)
-STAGE3_MAX = _env_int('OPENRAY_STAGE3_MAX', 5000, 1, 100000)
-
-
-def _adaptive_stage3_workers() -> int:
-    """Calculate optimal Stage 3 worker count (V2Ray core validation) - MAXIMUM PERFORMANCE."""
-    cpu_cores, memory_gb = _get_system_specs()
-
-    # Stage 3 is CPU+memory intensive (spawning V2Ray processes)
-    # Aggressive approach for maximum performance
-    if cpu_cores >= 8:
-        base_workers = cpu_cores * 3  # 3x cores for high-end systems
-        memory_per_process = 65  # More aggressive memory estimate
-    else:
-        base_workers = cpu_cores * 2  # 2x cores for standard systems
-        memory_per_process = 75  # Balanced memory estimate
-
-    # Memory constraint: V2Ray processes use ~65-100MB each
-    max_by_memory = int(memory_gb * 1024 / memory_per_process)
-
-    # Apply reasonable bounds
-    workers = min(base_workers, max_by_memory)
-
-    # In CI environments, keep this modest to avoid OOM and process thrash
-    if _is_ci_env():
-        workers = min(workers, 16)
-
-    return max(8, min(workers, 128))  # Range: 8-128 workers (increased for performance)
-
-# Stage 3 adaptive workers (maximum performance)
-STAGE3_WORKERS = _env_int('OPENRAY_STAGE3_WORKERS',
-                         max(_adaptive_stage3_workers(), 24), 4, 512)
+ENABLE_STAGE2 = CFG['OPENRAY_ENABLE_STAGE2']
+ASYNC_STAGE2 = CFG['OPENRAY_ASYNC_STAGE2']
+ASYNC_STAGE2_CONCURRENCY = CFG['OPENRAY_ASYNC_STAGE2_CONCURRENCY']
+PROBE_TIMEOUT_MS = CFG['OPENRAY_PROBE_TIMEOUT_MS']
+ENABLE_STAGE3 = CFG['OPENRAY_ENABLE_STAGE3']
+STAGE3_MAX = CFG['OPENRAY_STAGE3_MAX']
+STAGE3_WORKERS = CFG['OPENRAY_STAGE3_WORKERS']
+STAGE3_BATCH = CFG['OPENRAY_STAGE3_BATCH']
 
 # Limit for number of new URIs processed per run (overridable)
-NEW_URIS_LIMIT_ENABLED = _env_int('OPENRAY_NEW_URIS_LIMIT_ENABLED', 1, 0, 1)
-NEW_URIS_LIMIT = _env_int('OPENRAY_NEW_URIS_LIMIT', 25000, 1, 1000000)
-
+NEW_URIS_LIMIT_ENABLED = CFG['OPENRAY_NEW_URIS_LIMIT_ENABLED']
+NEW_URIS_LIMIT = CFG['OPENRAY_NEW_URIS_LIMIT']
+GROUPED_FULL_EVERY = CFG['OPENRAY_GROUPED_FULL_EVERY']
+DNS_CACHE_TTL = CFG['OPENRAY_DNS_CACHE_TTL']
+CONNECTIVITY_TIMEOUT = CFG['OPENRAY_CONNECTIVITY_TIMEOUT']
+PROBE_RATE = CFG['OPENRAY_PROBE_RATE']
+PRETTY_CHECK_COUNTS = CFG['OPENRAY_PRETTY_CHECK_COUNTS']
+TRUST_STREAK = CFG['OPENRAY_TRUST_STREAK']
+TRUST_WINDOW = CFG['OPENRAY_TRUST_WINDOW']
+TRUST_SAMPLE_PCT = CFG['OPENRAY_TRUST_SAMPLE_PCT']
+
+@functools.lru_cache(maxsize=1)
 def _auto_find_v2ray_core() -> str:
     # Priority 1: explicit env OPENRAY_V2RAY_CORE
     try:
@@ -372,22 +490,16 @@ def _auto_find_v2ray_core() -> str:
     except Exception:
         env = ''
 
-    def _exists(p: str) -> bool:
-        try:
-            return bool(p) and os.path.exists(p)
-        except Exception:
-            return False
-
     if env:
         p = env
         if not os.path.isabs(p):
             cand = os.path.join(REPO_ROOT, p)
-            if _exists(cand):
+            if os.path.isfile(cand):
                 return cand
             w = shutil.which(p)
             if w:
                 return w
-        if _exists(p):
+        if os.path.isfile(p):
             return p
 
     # Priority 2: PATH lookup
@@ -396,22 +508,22 @@ def _auto_find_v2ray_core() -> str:
         if w:
             return w
 
-    # Priority 3: Local repo candidates
-    for folder in (REPO_ROOT, os.path.join(REPO_ROOT, 'bin'), os.path.join(REPO_ROOT, 'tools')):
-        for name in ('xray.exe', 'v2ray.exe', 'xray', 'v2ray'):
-            p = os.path.join(folder, name)
-            if _exists(p):
-                return p
-
-    return ''
+    # Priority 3: Local repo candidates (first hit wins)
+    candidates = (
+        os.path.join(folder, name)
+        for folder in (REPO_ROOT, os.path.join(REPO_ROOT, 'bin'), os.path.join(REPO_ROOT, 'tools'))
+        for name in ('xray.exe', 'v2ray.exe', 'xray', 'v2ray')
+    )
+    return next((p for p in candidates if os.path.isfile(p)), '')
 
 V2RAY_CORE_PATH = _auto_find_v2ray_core()
 
 # Streak selection parameters (overridable)
-CONSECUTIVE_REQUIRED = _env_int('OPENRAY_STREAK_REQUIRED', 5, 1, 100)
+CONSECUTIVE_REQUIRED = CFG['OPENRAY_STREAK_REQUIRED']
 
-# Debug mode - set OPENRAY_DEBUG=1 to enable detailed parameter logging
-if os.environ.get('OPENRAY_DEBUG', '').strip() in ('1', 'true', 'yes'):
+def _print_debug() -> None:
+    """Print the resolved tuning parameters (OPENRAY_DEBUG=1)."""
+    cpu_cores, memory_gb = _get_system_specs()
     print("\n" + "="*70)
     print("🚀 OPENRAY MAXIMUM PERFORMANCE PARAMETERS")
     print("="*70)
@@ -419,13 +531,18 @@ if os.environ.get('OPENRAY_DEBUG', '').strip() in ('1', 'true', 'yes'):
     print(f"   FETCH_WORKERS: {FETCH_WORKERS} (was: {_opt_fetch})")
     print(f"   PING_WORKERS: {PING_WORKERS} (was: {_opt_ping})")
     print(f"   STAGE3_WORKERS: {STAGE3_WORKERS}")
+    print(f"   STAGE3_BATCH: {STAGE3_BATCH}")
     print("⏱️  TIMEOUTS:")
     print(f"   PING_TIMEOUT_MS: {PING_TIMEOUT_MS}ms (auto: {_opt_ping_timeout}ms)")
     print(f"   CONNECT_TIMEOUT_MS: {CONNECT_TIMEOUT_MS}ms (auto: {_opt_connect_timeout}ms)")
     print(f"   PROBE_TIMEOUT_MS: {PROBE_TIMEOUT_MS}ms (auto: {_opt_probe_timeout}ms)")
     print("📊 SYSTEM INFO:")
-    cpu_cores, memory_gb = _get_system_specs()
     print(f"   CPU Cores: {cpu_cores}")
     print(f"   Memory: {memory_gb:.1f}GB")
     print(f"   Environment: {'CI' if _CI else 'Local'}")
     print("="*70 + "\n")
+
+
+# Debug mode - set OPENRAY_DEBUG=1 to enable detailed parameter logging
+if os.environ.get('OPENRAY_DEBUG', '').strip() in ('1', 'true', 'yes'):
+    _print_debug()
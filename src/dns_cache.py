@@ -0,0 +1,76 @@
+from __future__ import annotations
+
+import concurrent.futures
+import socket
+import threading
+import time
+from typing import Dict, Iterable, List, Tuple
+
+from .common import _io_workers
+from .constants import DNS_CACHE_TTL
+
+_orig_getaddrinfo = socket.getaddrinfo
+_ttl = float(DNS_CACHE_TTL)
+_lock = threading.Lock()
+# (host, family, type, proto, flags) -> (getaddrinfo result for port 0, expiry on time.monotonic())
+_cache: Dict[Tuple, Tuple[List[tuple], float]] = {}
+
+
+def _with_port(infos: List[tuple], port: int) -> List[tuple]:
+    if not port:
+        return list(infos)
+    return [(fam, st, pr, cn, (sa[0], port) + tuple(sa[2:])) for fam, st, pr, cn, sa in infos]
+
+
+def cached_getaddrinfo(host, port, family=0, type=0, proto=0, flags=0):
+    """Drop-in socket.getaddrinfo() that reuses answers per host for the cache TTL.
+
+    Answers are cached without the port and the requested one is filled in, so
+    every port of a host shares one lookup. When the resolver fails, the last
+    good answer is served even if expired (RFC 8767 serve-stale).
+    """
+    if isinstance(port, str) and port.isdigit():
+        port = int(port)
+    if not host or not (port is None or isinstance(port, int)) or _ttl <= 0:
+        return _orig_getaddrinfo(host, port, family, type, proto, flags)
+    # TCP asked for via socktype or protocol gives the same answer either way
+    if (type, proto) in ((socket.SOCK_STREAM, 0), (0, socket.IPPROTO_TCP)):
+        type, proto = socket.SOCK_STREAM, socket.IPPROTO_TCP
+    key = (host, family, type, proto, flags)
+    now = time.monotonic()
+    with _lock:
+        hit = _cache.get(key)
+    if hit is not None and hit[1] > now:
+        return _with_port(hit[0], port or 0)
+    try:
+        infos = _orig_getaddrinfo(host, None, family, type, proto, flags)
+    except OSError:
+        if hit is not None:
+            return _with_port(hit[0], port or 0)
+        raise
+    with _lock:
+        _cache[key] = (infos, now + _ttl)
+    return _with_port(infos, port or 0)
+
+
+def install(ttl: float = DNS_CACHE_TTL) -> None:
+    """Route this process's socket.getaddrinfo() (and so create_connection/asyncio) through the cache."""
+    global _ttl
+    _ttl = float(ttl)
+    socket.getaddrinfo = cached_getaddrinfo
+
+
+def prewarm(hosts: Iterable[str], workers: int = 64) -> None:
+    """Resolve every distinct host concurrently so later checks start from a warm cache."""
+    unique = list(dict.fromkeys(h for h in hosts if h))
+    if not unique:
+        return
+
+    def _resolve(host: str) -> None:
+        try:
+            socket.getaddrinfo(host, None, proto=socket.IPPROTO_TCP)
+        except Exception:
+            pass
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=_io_workers(len(unique), workers)) as pool:
+        list(pool.map(_resolve, unique))
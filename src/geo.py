@@ -2,12 +2,28 @@ from __future__ import annotations
 
 
 from typing import Dict, Iterable, Optional, Tuple
+import atexit
+import functools
 import os
+import string
 import geoip2.database
 from .parsing import is_ip_address
 
 
 from .parsing import _extract_our_cc_and_num_from_uri
+
+
+_DEFAULT_MMDB_PATH = os.path.join(os.path.dirname(__file__), "../GeoLite2-Country.mmdb")
+
+
+@functools.lru_cache(maxsize=4)
+def _get_reader(mmdb_path: str) -> geoip2.database.Reader:
+    """Open the mmdb once per path and keep it mapped; Reader is safe for concurrent lookups."""
+    reader = geoip2.database.Reader(mmdb_path)
+    atexit.register(reader.close)
+    return reader
+
+
 def get_country_code_geoip2(ip: str, mmdb_path: str = None) -> Optional[str]:
     """
     Returns 2-letter country code for a static IP using local GeoLite2-Country.mmdb.
@@ -16,12 +32,9 @@ def get_country_code_geoip2(ip: str, mmdb_path: str = None) -> Optional[str]:
     if not is_ip_address(ip):
         return None
     if mmdb_path is None:
-        mmdb_path = os.path.join(os.path.dirname(__file__), "../GeoLite2-Country.mmdb")
+        mmdb_path = _DEFAULT_MMDB_PATH
     try:
-        reader = geoip2.database.Reader(mmdb_path)
-        response = reader.country(ip)
-        cc = response.country.iso_code
-        reader.close()
+        cc = _get_reader(mmdb_path).country(ip).country.iso_code
         if isinstance(cc, str) and len(cc) == 2:
             return cc.upper()
     except Exception:
@@ -29,23 +42,44 @@ def get_country_code_geoip2(ip: str, mmdb_path: str = None) -> Optional[str]:
     return None
 
 
-def _country_flag(cc: Optional[str]) -> str:
-    if not cc or len(cc) != 2 or not cc.isalpha():
-        return "🌐"
-    cc = cc.upper()
+def get_country_codes_geoip2_batch(ips: Iterable[str], mmdb_path: str = None) -> Dict[str, Optional[str]]:
+    """
+    Look up many IPs against one cached Reader. Duplicates are resolved once;
+    non-IPs and addresses missing from the database map to None.
+    """
+    result: Dict[str, Optional[str]] = dict.fromkeys(ips)
     try:
-        return chr(0x1F1E6 + ord(cc[0]) - 65) + chr(0x1F1E6 + ord(cc[1]) - 65)
+        reader = _get_reader(mmdb_path or _DEFAULT_MMDB_PATH)
     except Exception:
+        return result
+    for ip in result:
+        if not is_ip_address(ip):
+            continue
+        try:
+            cc = reader.country(ip).country.iso_code
+        except Exception:
+            continue
+        if isinstance(cc, str) and len(cc) == 2:
+            result[ip] = cc.upper()
+    return result
+
+
+# Regional-indicator pair for every two-letter code, built once at import
+_CC_TO_FLAG: Dict[str, str] = {
+    a + b: chr(0x1F1E6 + ord(a) - 65) + chr(0x1F1E6 + ord(b) - 65)
+    for a in string.ascii_uppercase for b in string.ascii_uppercase
+}
+
+
+def _country_flag(cc: Optional[str]) -> str:
+    if not cc:
         return "🌐"
+    return _CC_TO_FLAG.get(cc.upper(), "🌐")
 
 
 def _build_country_counters(existing: Iterable[str]) -> Dict[str, int]:
     counters: Dict[str, int] = {}
-    for line in existing:
-        parsed = _extract_our_cc_and_num_from_uri(line)
-        if parsed:
-            cc, num = parsed
-            prev = counters.get(cc, 0)
-            if num > prev:
-                counters[cc] = num
+    for cc, num in filter(None, map(_extract_our_cc_and_num_from_uri, existing)):
+        if num > counters.get(cc, 0):
+            counters[cc] = num
     return counters
@@ -1,96 +1,134 @@
 from __future__ import annotations
 
 import os
-from typing import Dict, List, Set
+from typing import Dict, Iterable, List, Optional, Set
 
-from .constants import AVAILABLE_FILE, KIND_DIR, COUNTRY_DIR
+from .constants import AVAILABLE_FILE, KIND_DIR, COUNTRY_DIR, GROUPED_RUNS_FILE, GROUPED_FULL_EVERY
 from .common import log
-from .io_ops import read_lines, write_text_file_atomic
+from .io_ops import append_lines, iter_lines, read_lines, write_text_file_atomic
 from .parsing import _extract_our_cc_and_num_from_uri
 
 
-def write_grouped_outputs() -> None:
+def _read_grouped_runs() -> int:
+    """Incremental runs since the last full rewrite, or -1 if there is no incremental state."""
+    try:
+        with open(GROUPED_RUNS_FILE, 'r', encoding='utf-8') as f:
+            return int(f.read().strip() or 0)
+    except (OSError, ValueError):
+        return -1
+
+
+def _write_grouped_runs(n: int) -> None:
+    try:
+        write_text_file_atomic(GROUPED_RUNS_FILE, [str(n)])
+    except Exception:
+        pass
+
+
+def append_grouped(new_entries_by_cc: Dict[str, List[str]]) -> bool:
+    """Append this run's new entries to the per-kind and per-country files.
+
+    Returns False, without writing anything, when a full write_grouped_outputs()
+    is due instead: no incremental state yet, or GROUPED_FULL_EVERY runs since the
+    last full rewrite.
+    """
+    runs = _read_grouped_runs()
+    if runs < 0 or runs >= int(GROUPED_FULL_EVERY) or not os.path.isdir(COUNTRY_DIR):
+        return False
+    try:
+        kind_groups: Dict[str, List[str]] = {}
+        for entries in new_entries_by_cc.values():
+            for s in entries:
+                head, sep, _ = s.partition('://')
+                kind_groups.setdefault((head.lower() if sep else '') or 'unknown', []).append(s)
+        os.makedirs(KIND_DIR, exist_ok=True)
+        for scheme, entries in kind_groups.items():
+            append_lines(os.path.join(KIND_DIR, f'{scheme}.txt'), entries)
+        for cc, entries in new_entries_by_cc.items():
+            append_lines(os.path.join(COUNTRY_DIR, f'{cc}.txt'), entries)
+    except Exception as e:
+        log(f"Appending grouped outputs failed: {e}")
+        return False
+    _write_grouped_runs(runs + 1)
+    return True
+
+
+def write_grouped_outputs(uris: Optional[Iterable[str]] = None) -> None:
     """Generate per-kind and per-country files from AVAILABLE_FILE.
 
     - output/kind/<scheme>.txt
     - output/country/<CC>.txt (uses an existing remark format; falls back to XX)
+
+    Callers that just wrote AVAILABLE_FILE can pass its lines as `uris` to skip re-reading it.
     """
     try:
-        lines = [ln.strip() for ln in read_lines(AVAILABLE_FILE) if ln.strip()]
+        if uris is None:
+            uris = read_lines(AVAILABLE_FILE)
+        lines = [ln.strip() for ln in uris if ln.strip()]
         if not lines:
             return
 
-        # Group by scheme (kind)
-        kind_order: List[str] = []
+        # One pass groups by scheme (kind) and by country code (from our remark; fallback XX).
+        # Dicts keep first-seen order, which is the file order.
         kind_groups: Dict[str, List[str]] = {}
+        cc_groups: Dict[str, List[str]] = {}
         for s in lines:
-            scheme = s.split('://', 1)[0].lower() if '://' in s else 'unknown'
-            if not scheme:
-                scheme = 'unknown'
-            if scheme not in kind_groups:
-                kind_groups[scheme] = []
-                kind_order.append(scheme)
-            kind_groups[scheme].append(s)
+            head, sep, _ = s.partition('://')
+            scheme = (head.lower() if sep else '') or 'unknown'
+            kind_groups.setdefault(scheme, []).append(s)
+            parsed = _extract_our_cc_and_num_from_uri(s)
+            cc = parsed[0] if parsed else 'XX'
+            cc_groups.setdefault(cc, []).append(s)
 
         os.makedirs(KIND_DIR, exist_ok=True)
         produced_kind: Set[str] = set()
-        for scheme in kind_order:
+        for scheme in kind_groups:
             out_path = os.path.join(KIND_DIR, f'{scheme}.txt')
             write_text_file_atomic(out_path, kind_groups[scheme])
             produced_kind.add(f'{scheme}.txt')
         # Remove stale kind txt files
         try:
-            for name in os.listdir(KIND_DIR):
-                p = os.path.join(KIND_DIR, name)
-                if os.path.isfile(p) and name.lower().endswith('.txt') and name not in produced_kind:
-                    try:
-                        os.remove(p)
-                    except Exception:
-                        pass
+            with os.scandir(KIND_DIR) as it:
+                for entry in it:
+                    name = entry.name
+                    if name.lower().endswith('.txt') and name not in produced_kind and entry.is_file():
+                        try:
+                            os.remove(entry.path)
+                        except Exception:
+                            pass
         except Exception:
             pass
 
-        # Group by country code (from our remark); fallback to XX
-        cc_order: List[str] = []
-        cc_groups: Dict[str, List[str]] = {}
-        for s in lines:
-            parsed = _extract_our_cc_and_num_from_uri(s)
-            cc = parsed[0] if parsed else 'XX'
-            if cc not in cc_groups:
-                cc_groups[cc] = []
-                cc_order.append(cc)
-            cc_groups[cc].append(s)
-
         os.makedirs(COUNTRY_DIR, exist_ok=True)
         produced_cc: Set[str] = set()
-        for cc in cc_order:
+        for cc in cc_groups:
             out_path = os.path.join(COUNTRY_DIR, f'{cc}.txt')
             write_text_file_atomic(out_path, cc_groups[cc])
             produced_cc.add(f'{cc}.txt')
         # Remove stale country txt files
         try:
-            for name in os.listdir(COUNTRY_DIR):
-                p = os.path.join(COUNTRY_DIR, name)
-                if os.path.isfile(p) and name.lower().endswith('.txt') and name not in produced_cc:
-                    try:
-                        os.remove(p)
-                    except Exception:
-                        pass
+            with os.scandir(COUNTRY_DIR) as it:
+                for entry in it:
+                    name = entry.name
+                    if name.lower().endswith('.txt') and name not in produced_cc and entry.is_file():
+                        try:
+                            os.remove(entry.path)
+                        except Exception:
+                            pass
         except Exception:
             pass
+        _write_grouped_runs(0)
 
     except Exception as e:
         log(f"Writing grouped outputs failed: {e}")
 
 
-def regroup_available_by_country() -> None:
+def regroup_available_by_country() -> Optional[List[str]]:
+    """Rewrite AVAILABLE_FILE with entries grouped by country; returns the lines written."""
     try:
-        lines = read_lines(AVAILABLE_FILE)
-        if not lines:
-            return
         order: List[str] = []
         groups: Dict[str, List[str]] = {}
-        for line in lines:
+        for line in iter_lines(AVAILABLE_FILE):
             s = line.strip()
             if not s:
                 continue
@@ -100,13 +138,18 @@ def regroup_available_by_country() -> None:
                 groups[cc] = []
                 order.append(cc)
             groups[cc].append(s)
+        if not groups:
+            return None
         tmp_path = AVAILABLE_FILE + '.tmp'
+        out: List[str] = []
+        for cc in order:
+            out.extend(groups[cc])
         with open(tmp_path, 'w', encoding='utf-8', errors='ignore') as f:
-            for cc in order:
-                for item in groups[cc]:
-                    f.write(item)
-                    f.write('\n')
+            f.write('\n'.join(out))
+            f.write('\n')
         os.replace(tmp_path, AVAILABLE_FILE)
         log(f"Regrouped available proxies by country into {len(order)} groups")
+        return out
     except Exception as e:
         log(f"Regroup failed: {e}")
+        return None
@@ -0,0 +1,31 @@
+from __future__ import annotations
+
+from typing import Optional
+
+from .constants import FETCH_WORKERS, USER_AGENT
+
+try:
+    import requests  # type: ignore
+    from requests.adapters import HTTPAdapter  # type: ignore
+except Exception:
+    requests = None
+    HTTPAdapter = None
+
+
+def _build_session(pool_maxsize: int) -> Optional["requests.Session"]:
+    """One keep-alive session whose per-host pool fits the fetch concurrency; None without requests."""
+    if requests is None:
+        return None
+    try:
+        session = requests.Session()
+        session.headers.update({'User-Agent': USER_AGENT, 'Accept': '*/*'})
+        adapter = HTTPAdapter(pool_connections=64, pool_maxsize=pool_maxsize)
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        return session
+    except Exception:
+        return None
+
+
+# Shared by the urllib-style call sites in net.py; they fall back to urlopen when this is None
+SESSION = _build_session(max(32, int(FETCH_WORKERS)))
@@ -2,10 +2,22 @@ from __future__ import annotations
 
 import json
 import os
+import contextlib
 import hashlib
+import mmap
 import struct
 import time
-from typing import Iterable, List, Set, Dict
+from typing import Any, Iterable, Iterator, List, Optional, Set, Dict, Tuple, Union
+
+try:
+    import numpy as _np  # type: ignore
+except Exception:
+    _np = None
+
+try:
+    import orjson as _orjson  # type: ignore
+except Exception:
+    _orjson = None
 
 try:
     from .constants import STATE_DIR, OUTPUT_DIR, TESTED_FILE, AVAILABLE_FILE, STREAKS_FILE
@@ -26,84 +38,282 @@ def ensure_dirs() -> None:
 
 
 def read_lines(path: str) -> List[str]:
-    if not os.path.exists(path):
+    try:
+        f = open(path, 'r', encoding='utf-8', errors='ignore')
+    except FileNotFoundError:
         return []
-    with open(path, 'r', encoding='utf-8', errors='ignore') as f:
+    with f:
         return [line.rstrip('\r\n') for line in f]
 
 
+def _read_lines_if_exists(path: str) -> Optional[List[str]]:
+    """Stripped non-empty lines of `path`, or None if it does not exist (one open, no stat first)."""
+    try:
+        f = open(path, 'r', encoding='utf-8', errors='ignore')
+    except FileNotFoundError:
+        return None
+    with f:
+        return [s for s in map(str.strip, f) if s]
+
+
+def iter_lines(path: str, bufsize: int = 1 << 20) -> Iterator[str]:
+    """Stream lines through a large read buffer without materializing the whole file."""
+    try:
+        f = open(path, 'r', encoding='utf-8', errors='ignore', buffering=bufsize)
+    except FileNotFoundError:
+        return
+    with f:
+        for line in f:
+            yield line.rstrip('\r\n')
+
+
 def append_lines(path: str, lines: Iterable[str]) -> None:
     if not lines:
         return
-    with open(path, 'a', encoding='utf-8', errors='ignore') as f:
-        for line in lines:
-            f.write(line)
-            if not line.endswith('\n'):
-                f.write('\n')
+    # Encoded once and handed to the OS in a single write
+    payload = ''.join(line if line.endswith('\n') else line + '\n' for line in lines)
+    if not payload:
+        return
+    with open(path, 'ab') as f:
+        f.write(payload.encode('utf-8', errors='ignore'))
 
 
-def write_text_file_atomic(path: str, lines: List[str]) -> None:
+def write_text_file_atomic(path: str, lines: List[str], fsync: bool = False) -> None:
     try:
         os.makedirs(os.path.dirname(path), exist_ok=True)
     except Exception:
         pass
     tmp = path + '.tmp'
-    with open(tmp, 'w', encoding='utf-8', errors='ignore') as f:
-        for ln in lines:
-            f.write(ln)
-            f.write('\n')
+    # One encoded payload handed straight to os.write (no per-line or buffered-layer writes)
+    payload = ('\n'.join(lines) + '\n').encode('utf-8', errors='ignore') if lines else b''
+    fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o666)
+    try:
+        view = memoryview(payload)
+        while view:
+            view = view[os.write(fd, view):]
+        if fsync:
+            os.fsync(fd)
+    finally:
+        os.close(fd)
     os.replace(tmp, path)
 
 
 # Persistence helpers
 
+def _set_from_file(path: str) -> Set[str]:
+    """Non-blank stripped lines of a file as a set, built in a single pass."""
+    try:
+        f = open(path, 'r', encoding='utf-8', errors='ignore', buffering=1 << 20)
+    except FileNotFoundError:
+        return set()
+    with f:
+        return {s for s in map(str.strip, f) if s}
+
+
 def load_tested_hashes() -> Set[str]:
-    tested: Set[str] = set()
-    for line in read_lines(TESTED_FILE):
-        h = line.strip()
-        if h:
-            tested.add(h)
-    return tested
+    return _set_from_file(TESTED_FILE)
 
 
 def load_existing_available() -> Set[str]:
-    existing: Set[str] = set()
-    for line in read_lines(AVAILABLE_FILE):
-        s = line.strip()
-        if s:
-            existing.add(s)
-    return existing
+    return _set_from_file(AVAILABLE_FILE)
+
+
+# Binary streaks: b'ORS1' + u32 host count, then per host a u16 name length, the
+# UTF-8 name and u32 streak/last_test/last_success. Preferred over streaks.json,
+# which is still read when no binary file exists yet (and kept as-is, like tested.txt).
+_STREAKS_MAGIC = b'ORS1'
+_STREAKS_COUNT = struct.Struct('>I')
+_STREAK_NAME_LEN = struct.Struct('>H')
+_STREAK_VALUES = struct.Struct('>III')
+
+
+def _streaks_bin_file() -> str:
+    return os.path.splitext(STREAKS_FILE)[0] + '.bin'
+
+
+# Streaks journal: one "host\tstreak\tlast_test\tlast_success" line per changed host,
+# replayed over the snapshot above by load_streaks() until save_streaks() folds it in.
+_STREAKS_LOG_COMPACT_RATIO = 4
+
+
+def _streaks_log_file() -> str:
+    return os.path.splitext(STREAKS_FILE)[0] + '.log'
+
+
+def _replay_streaks_log(streaks: Dict[str, Dict[str, int]]) -> None:
+    try:
+        f = open(_streaks_log_file(), 'r', encoding='utf-8', errors='ignore')
+    except FileNotFoundError:
+        return
+    with f:
+        for line in f:
+            parts = line.rstrip('\n').split('\t')
+            if len(parts) != 4:
+                continue  # torn last line of an interrupted append
+            try:
+                streaks[parts[0]] = {'streak': int(parts[1]), 'last_test': int(parts[2]),
+                                     'last_success': int(parts[3])}
+            except ValueError:
+                continue
+
+
+def _discard_streaks_log() -> None:
+    try:
+        os.remove(_streaks_log_file())
+    except FileNotFoundError:
+        pass
+
+
+def _load_streaks_bin(path: str) -> Optional[Dict[str, Dict[str, int]]]:
+    """Streaks from the binary file; None if it does not exist or is not in that format."""
+    try:
+        with open(path, 'rb') as f:
+            data = f.read()
+    except FileNotFoundError:
+        return None
+    if data[:4] != _STREAKS_MAGIC:
+        return None
+    count, = _STREAKS_COUNT.unpack_from(data, 4)
+    off = 8
+    name_len = _STREAK_NAME_LEN.unpack_from
+    values = _STREAK_VALUES.unpack_from
+    streaks: Dict[str, Dict[str, int]] = {}
+    for _ in range(count):
+        n, = name_len(data, off)
+        off += 2
+        host = data[off:off + n].decode('utf-8', errors='ignore')
+        off += n
+        streak, last_test, last_success = values(data, off)
+        off += 12
+        streaks[host] = {'streak': streak, 'last_test': last_test, 'last_success': last_success}
+    return streaks
+
+
+def _pack_streaks(streaks: Dict[str, Dict[str, int]]) -> bytes:
+    name_len = _STREAK_NAME_LEN.pack
+    values = _STREAK_VALUES.pack
+    parts = [_STREAKS_MAGIC, _STREAKS_COUNT.pack(len(streaks))]
+    for host, rec in streaks.items():
+        name = host.encode('utf-8', errors='ignore')
+        parts.append(name_len(len(name)))
+        parts.append(name)
+        parts.append(values(int(rec.get('streak', 0)), int(rec.get('last_test', 0)), int(rec.get('last_success', 0))))
+    return b''.join(parts)
 
 
 def load_streaks() -> Dict[str, Dict[str, int]]:
+    streaks = _load_streaks_snapshot()
     try:
-        if not os.path.exists(STREAKS_FILE):
-            return {}
-        with open(STREAKS_FILE, 'r', encoding='utf-8', errors='ignore') as f:
-            data = json.load(f)
-            if isinstance(data, dict):
-                # Ensure numeric fields are ints
-                cleaned: Dict[str, Dict[str, int]] = {}
-                for host, obj in data.items():
-                    if not isinstance(obj, dict):
-                        continue
-                    streak = int(obj.get('streak', 0))
-                    last_test = int(obj.get('last_test', 0))
-                    last_success = int(obj.get('last_success', 0))
-                    cleaned[host] = {'streak': streak, 'last_test': last_test, 'last_success': last_success}
-                return cleaned
+        _replay_streaks_log(streaks)
+    except Exception:
+        pass
+    return streaks
+
+
+def _load_streaks_snapshot() -> Dict[str, Dict[str, int]]:
+    try:
+        streaks = _load_streaks_bin(_streaks_bin_file())
+        if streaks is not None:
+            return streaks
+    except Exception:
+        pass  # truncated/corrupt binary file: fall back to the JSON copy
+    try:
+        with open(STREAKS_FILE, 'rb') as f:
+            raw = f.read()
+        data = None
+        if _orjson is not None:
+            try:
+                data = _orjson.loads(raw)
+            except Exception:
+                pass  # e.g. stray invalid UTF-8; the lenient json path below copes
+        if data is None:
+            data = json.loads(raw.decode('utf-8', errors='ignore'))
+        if isinstance(data, dict):
+            # Ensure numeric fields are ints
+            cleaned: Dict[str, Dict[str, int]] = {}
+            for host, obj in data.items():
+                if not isinstance(obj, dict):
+                    continue
+                streak = int(obj.get('streak', 0))
+                last_test = int(obj.get('last_test', 0))
+                last_success = int(obj.get('last_success', 0))
+                cleaned[host] = {'streak': streak, 'last_test': last_test, 'last_success': last_success}
+            return cleaned
     except Exception:
         pass
     return {}
 
 
+def _save_streaks_json(streaks: Dict[str, Dict[str, int]]) -> None:
+    tmp = STREAKS_FILE + '.tmp'
+    if _orjson is not None:
+        blob = _orjson.dumps(streaks)
+    else:
+        blob = json.dumps(streaks, ensure_ascii=False).encode('utf-8', errors='ignore')
+    # Serialized up front so the file gets one write
+    with open(tmp, 'wb') as f:
+        f.write(blob)
+    os.replace(tmp, STREAKS_FILE)
+
+
 def save_streaks(streaks: Dict[str, Dict[str, int]]) -> None:
     try:
         os.makedirs(STATE_DIR, exist_ok=True)
-        tmp = STREAKS_FILE + '.tmp'
-        with open(tmp, 'w', encoding='utf-8', errors='ignore') as f:
-            json.dump(streaks, f, ensure_ascii=False)
-        os.replace(tmp, STREAKS_FILE)
+        try:
+            blob = _pack_streaks(streaks)
+        except (struct.error, ValueError, TypeError, AttributeError):
+            # Something the fixed layout can't hold (e.g. a negative or >32-bit value):
+            # save as JSON and drop the binary file so the stale copy isn't preferred
+            _save_streaks_json(streaks)
+            try:
+                os.remove(_streaks_bin_file())
+            except FileNotFoundError:
+                pass
+            _discard_streaks_log()
+            return
+        bin_file = _streaks_bin_file()
+        tmp = bin_file + '.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(blob)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, bin_file)
+        # The snapshot now holds everything the journal did
+        _discard_streaks_log()
+    except Exception:
+        # best-effort; ignore
+        pass
+
+
+def append_streak_deltas(streaks: Dict[str, Dict[str, int]], hosts: Iterable[str]) -> None:
+    """Journal the records of `hosts` instead of rewriting the whole streaks snapshot.
+
+    Compacts with a full save_streaks() once the journal outgrows the snapshot
+    _STREAKS_LOG_COMPACT_RATIO times over.
+    """
+    try:
+        lines: List[str] = []
+        for host in hosts:
+            rec = streaks.get(host)
+            if rec is None or '\t' in host or '\n' in host:
+                continue
+            lines.append(f"{host}\t{int(rec.get('streak', 0))}\t{int(rec.get('last_test', 0))}\t"
+                         f"{int(rec.get('last_success', 0))}\n")
+        if not lines:
+            return
+        os.makedirs(STATE_DIR, exist_ok=True)
+        log_path = _streaks_log_file()
+        with open(log_path, 'a', encoding='utf-8', errors='ignore') as f:
+            f.write(''.join(lines))
+        snapshot = _streaks_bin_file()
+        if not os.path.exists(snapshot):
+            snapshot = STREAKS_FILE
+        try:
+            snapshot_size = os.path.getsize(snapshot)
+        except OSError:
+            snapshot_size = 0
+        if os.path.getsize(log_path) > _STREAKS_LOG_COMPACT_RATIO * snapshot_size:
+            save_streaks(streaks)
     except Exception:
         # best-effort; ignore
         pass
@@ -111,6 +321,17 @@ def save_streaks(streaks: Dict[str, Dict[str, int]]) -> None:
 
 # Optimized tested hashes storage using binary format
 TESTED_BIN_FILE = TESTED_FILE + '.bin'
+# One record: big-endian 8-byte timestamp + 20-byte hash; compiled once, not per entry
+_TESTED_RECORD = struct.Struct('>Q20s')
+
+
+def _pack_records(records: List[Tuple[int, bytes]]) -> bytearray:
+    """(timestamp, hash) pairs packed into one preallocated buffer, no per-record bytes objects."""
+    buf = bytearray(len(records) * _TESTED_RECORD.size)
+    pack_into = _TESTED_RECORD.pack_into
+    for i, (ts, h) in enumerate(records):
+        pack_into(buf, i * 28, ts, h)
+    return buf
 
 def hash_to_bytes(hash_str: str) -> bytes:
     """Convert hex hash string to 20 bytes."""
@@ -120,14 +341,102 @@ def bytes_to_hash(hash_bytes: bytes) -> str:
     """Convert 20 bytes back to hex hash string."""
     return hash_bytes.hex()
 
+
+def _to_hash_bytes(h: Union[str, bytes]) -> bytes:
+    """Accept either a raw 20-byte digest or its hex form; raises ValueError on bad hex."""
+    if isinstance(h, (bytes, bytearray)):
+        return bytes(h)
+    return hash_to_bytes(h.strip())
+
+
+# Below this size a plain read() beats setting up a mapping
+_MMAP_MIN_SIZE = 1 << 20
+_TESTED_DTYPE = _np.dtype([('ts', '>u8'), ('h', 'V20')]) if _np is not None else None
+
+
+@contextlib.contextmanager
+def _bin_view(f, size: int):
+    """Whole-file buffer: read() for small files, a read-only mmap for large ones."""
+    if size < _MMAP_MIN_SIZE:
+        yield f.read()
+        return
+    with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        yield mm
+
+
+def _read_bin_hashes(bin_file: str) -> List[bytes]:
+    """Raw hashes of every complete 28-byte (timestamp, hash) record in a binary tested file."""
+    with open(bin_file, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        count = size // 28
+        if not count:
+            return []
+        with _bin_view(f, size) as mm:
+            if _np is not None:
+                # One zero-copy view over all records; 'V20' keeps trailing NUL bytes that 'S20' would strip
+                recs = _np.frombuffer(mm, dtype=_TESTED_DTYPE, count=count)
+                blob = recs['h'].tobytes()
+                del recs  # release the buffer export before the mmap closes
+                return [blob[i:i + 20] for i in range(0, len(blob), 20)]
+            # One precompiled Struct walking the whole-record prefix of the buffer
+            with memoryview(mm) as view:
+                return [h for _ts, h in _TESTED_RECORD.iter_unpack(view[:count * 28])]
+
+
+def _read_text_hashes(tested_file: str) -> Iterator[bytes]:
+    for line in iter_lines(tested_file):
+        h = line.strip()
+        if h:
+            try:
+                yield hash_to_bytes(h)
+            except ValueError:
+                continue  # not a hash; it could never match one
+
+# Every tested hash known to this process, as 20-byte digests (half the memory of hex
+# strings): filled by a full load, then kept current by appends so they don't have to
+# re-read all tested files to dedupe. Valid while the files' (mtime, size) signature
+# still matches; anything else touching them forces the next load to re-read.
+_TESTED_CACHE: Optional[Set[bytes]] = None
+_TESTED_CACHE_SIG: Optional[Tuple[Tuple[str, int, int], ...]] = None
+
+
+def _tested_files_signature() -> Tuple[Tuple[str, int, int], ...]:
+    sig = []
+    for tested_file in get_all_tested_files():
+        for path in (tested_file, tested_file + '.bin'):
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            sig.append((path, st.st_mtime_ns, st.st_size))
+    return tuple(sig)
+
+
+def _get_tested_cache() -> Set[bytes]:
+    return load_tested_hash_bytes()
+
+
 def load_tested_hashes_optimized() -> Set[str]:
-    """Load tested hashes from all tested files (multi-file support)."""
+    """Load tested hashes from all tested files (multi-file support) as hex strings."""
+    return set(map(bytes_to_hash, load_tested_hash_bytes()))
+
+
+def load_tested_hash_bytes() -> Set[bytes]:
+    """Load tested hashes from all tested files as raw 20-byte digests.
+
+    The returned set also becomes the process-wide cache that later appends extend;
+    it is returned as-is while the tested files are unchanged on disk.
+    """
+    global _TESTED_CACHE, _TESTED_CACHE_SIG
     # Check for rotation before loading
     if should_rotate_tested_file():
-        print(f"File rotation needed before loading. Current file size: {os.path.getsize(get_current_tested_file()) / (1024 * 1024):.1f}MB")
+        print(f"File rotation needed before loading. Current file size: {_tested_file_size(get_current_tested_file()) / (1024 * 1024):.1f}MB")
         rotate_tested_file()
 
-    tested: Set[str] = set()
+    if _TESTED_CACHE is not None and _tested_files_signature() == _TESTED_CACHE_SIG:
+        return _TESTED_CACHE
+
+    tested: Set[bytes] = set()
 
     # Get all tested files
     tested_files = get_all_tested_files()
@@ -135,35 +444,13 @@ def load_tested_hashes_optimized() -> Set[str]:
     # Try optimized binary format first for each file
     for tested_file in tested_files:
         bin_file = tested_file + '.bin'
-        if os.path.exists(bin_file):
-            try:
-                with open(bin_file, 'rb') as f:
-                    # Read file in chunks for memory efficiency
-                    while True:
-                        # Read timestamp (8 bytes) + hash (20 bytes) = 28 bytes per entry
-                        entry = f.read(28)
-                        if not entry:
-                            break
-                        if len(entry) != 28:
-                            continue  # Skip malformed entries
-                        timestamp, hash_bytes = struct.unpack('>Q20s', entry)
-                        tested.add(bytes_to_hash(hash_bytes))
-            except Exception:
-                # Fallback to text format for this file if binary is corrupted
-                try:
-                    for line in read_lines(tested_file):
-                        h = line.strip()
-                        if h:
-                            tested.add(h)
-                except Exception:
-                    pass  # Skip corrupted files
-        else:
-            # Load from text format
+        try:
+            # Timestamp (8 bytes) + hash (20 bytes) = 28 bytes per entry; a short tail is skipped
+            tested.update(_read_bin_hashes(bin_file))
+        except Exception:
+            # No binary file, or a corrupted one: load from text format
             try:
-                for line in read_lines(tested_file):
-                    h = line.strip()
-                    if h:
-                        tested.add(h)
+                tested.update(_read_text_hashes(tested_file))
             except Exception:
                 pass  # Skip corrupted files
 
@@ -174,134 +461,146 @@ def load_tested_hashes_optimized() -> Set[str]:
         except Exception:
             pass  # Migration failure shouldn't break loading
 
+    _TESTED_CACHE = tested
+    _TESTED_CACHE_SIG = _tested_files_signature()  # after the migration rewrite
     return tested
 
-def migrate_to_optimized_format(hashes: Set[str]) -> None:
+
+def migrate_to_optimized_format(hashes: Iterable[Union[str, bytes]]) -> None:
     """Migrate existing text format to optimized binary format."""
     if not hashes:
         return
 
     current_time = int(time.time())
-    entries = []
 
-    for hash_str in hashes:
-        hash_str = hash_str.strip()
-        if not hash_str:
+    # Raw digests go through as-is; well-formed hex is decoded in one bulk
+    # bytes.fromhex call and sliced, anything else takes the per-item path.
+    digests: List[bytes] = []
+    hex_parts: List[str] = []
+    odd: List[str] = []
+    for h in hashes:
+        if not h:
             continue
+        if isinstance(h, bytes):
+            digests.append(h)
+            continue
+        h = h.strip()
+        if len(h) == 40:
+            hex_parts.append(h)
+        elif h:
+            odd.append(h)
+
+    if hex_parts:
+        try:
+            blob = bytes.fromhex(''.join(hex_parts))
+            digests.extend(blob[i:i + 20] for i in range(0, len(blob), 20))
+        except ValueError:
+            odd.extend(hex_parts)
+
+    for h in odd:
         try:
-            hash_bytes = hash_to_bytes(hash_str)
-            entries.append(struct.pack('>Q20s', current_time, hash_bytes))
+            digests.append(_to_hash_bytes(h))
         except Exception as e:
             # Log invalid hashes but continue
-            print(f"Warning: Skipping invalid hash: {hash_str[:16]}... ({e})")
-            continue
+            print(f"Warning: Skipping invalid hash: {h[:16]}... ({e})")
 
-    if entries:
+    if digests:
         try:
             # Write all entries at once for better performance
             with open(TESTED_BIN_FILE + '.tmp', 'wb') as f:
-                f.write(b''.join(entries))
+                f.write(_pack_records([(current_time, h) for h in digests]))
             os.replace(TESTED_BIN_FILE + '.tmp', TESTED_BIN_FILE)
-            print(f"Successfully migrated {len(entries)} hashes to binary format")
+            print(f"Successfully migrated {len(digests)} hashes to binary format")
         except Exception as e:
             print(f"Migration failed: {e}")
             pass  # Migration failure is non-critical
 
-def append_tested_hashes_optimized(new_hashes: Iterable[str]) -> None:
-    """Append new hashes to current active tested file with rotation support."""
+def append_tested_hashes_optimized(new_hashes: Iterable[Union[str, bytes]]) -> None:
+    """Append new hashes (hex strings or raw 20-byte digests) to current active tested file with rotation support."""
+    global _TESTED_CACHE_SIG
     if not new_hashes:
         return
 
     # Check if we need to rotate first
     if should_rotate_tested_file():
         # Rotate immediately if current file is already at/over limit
-        print(f"Current file is {os.path.getsize(get_current_tested_file()) / (1024 * 1024):.1f}MB >= 50MB, rotating...")
+        print(f"Current file is {_tested_file_size(get_current_tested_file()) / (1024 * 1024):.1f}MB >= 50MB, rotating...")
         rotate_tested_file()
 
     # Get current active file
     current_file = get_current_tested_file()
     bin_file = current_file + '.bin'
 
-    # Load existing hashes to check for duplicates (from all files)
-    existing_hashes = load_tested_hashes_optimized()
+    # Existing hashes (from all files) to check for duplicates; loaded at most once per process
+    existing_hashes = _get_tested_cache()
     current_time = int(time.time())
-    new_entries = []
+    new_entries: List[bytes] = []
 
-    for hash_str in new_hashes:
-        hash_str = hash_str.strip()
-        if not hash_str or hash_str in existing_hashes:
+    for h in new_hashes:
+        if not h:
             continue
-
         try:
-            hash_bytes = hash_to_bytes(hash_str)
-            new_entries.append(struct.pack('>Q20s', current_time, hash_bytes))
-            existing_hashes.add(hash_str)
+            hash_bytes = _to_hash_bytes(h)
         except Exception:
             continue  # Skip invalid hashes
+        if not hash_bytes or hash_bytes in existing_hashes:
+            continue
+        new_entries.append(hash_bytes)
+        existing_hashes.add(hash_bytes)
 
     if new_entries:
+        # Rotation follows the .bin size after the write (the same file and 50MB limit as
+        # should_rotate_tested_file), so the next batch starts a new file
+        max_bytes = 50 * 1024 * 1024
         try:
-            # Check file size before writing
-            if os.path.exists(current_file):
-                current_size_mb = os.path.getsize(current_file) / (1024 * 1024)
-                # Estimate size increase (each entry is ~41 bytes in text format)
-                estimated_new_size_mb = current_size_mb + (len(new_entries) * 41) / (1024 * 1024)
-
-                if estimated_new_size_mb >= 50:
-                    # Rotate to new file
-                    new_file = rotate_tested_file()
-                    current_file = new_file
-                    bin_file = new_file + '.bin'
-
             with open(bin_file, 'ab') as f:
-                for entry in new_entries:
-                    f.write(entry)
+                f.write(_pack_records([(current_time, h) for h in new_entries]))
+                size = f.tell()
+            if size >= max_bytes:
+                rotate_tested_file()
         except Exception:
             # Fallback to text format
             try:
-                # Check file size for text format too
-                if os.path.exists(current_file):
-                    current_size_mb = os.path.getsize(current_file) / (1024 * 1024)
-                    # Estimate size increase (each hash is ~41 bytes)
-                    estimated_new_size_mb = current_size_mb + (len(new_entries) * 41) / (1024 * 1024)
-
-                    if estimated_new_size_mb >= 50:
-                        # Rotate to new file
-                        new_file = rotate_tested_file()
-                        current_file = new_file
-
-                append_lines(current_file, (h for h in new_hashes if h.strip()))
+                append_lines(current_file, [bytes_to_hash(h) for h in new_entries])
+                if should_rotate_tested_file():
+                    rotate_tested_file()
             except Exception as e:
                 print(f"Failed to append hashes: {e}")
+        # Our own write: the cache already holds these entries
+        _TESTED_CACHE_SIG = _tested_files_signature()
 
 def cleanup_old_hashes(days_to_keep: int = 30) -> int:
     """Remove hashes older than specified days. Returns number of removed entries."""
-    if not os.path.exists(TESTED_BIN_FILE):
-        return 0
-
     cutoff_time = int(time.time()) - (days_to_keep * 24 * 60 * 60)
-    kept_entries = []
     removed_count = 0
 
     try:
-        with open(TESTED_BIN_FILE, 'rb') as f:
-            while True:
-                entry = f.read(28)
-                if not entry:
-                    break
-                if len(entry) != 28:
-                    continue
-                timestamp, hash_bytes = struct.unpack('>Q20s', entry)
-                if timestamp >= cutoff_time:
-                    kept_entries.append(entry)
+        f = open(TESTED_BIN_FILE, 'rb')
+    except FileNotFoundError:
+        return 0
+
+    try:
+        with f:
+            size = os.fstat(f.fileno()).st_size
+            count = size // 28  # a short trailing record is dropped on rewrite
+            with _bin_view(f, size) as buf:
+                if _np is not None:
+                    # Vectorized: one timestamp comparison over all records
+                    recs = _np.frombuffer(buf, dtype=_TESTED_DTYPE, count=count)
+                    keep = recs['ts'] >= cutoff_time
+                    removed_count = count - int(keep.sum())
+                    kept = recs[keep].tobytes() if removed_count > 0 else b''
+                    del recs, keep  # release the buffer export before the mmap closes
                 else:
-                    removed_count += 1
+                    with memoryview(buf) as view:
+                        kept_records = [rec for rec in _TESTED_RECORD.iter_unpack(view[:count * 28]) if rec[0] >= cutoff_time]
+                    removed_count = count - len(kept_records)
+                    kept = _pack_records(kept_records) if removed_count > 0 else b''
 
         if removed_count > 0:
             # Rewrite file with only kept entries
             with open(TESTED_BIN_FILE + '.tmp', 'wb') as f:
-                for entry in kept_entries:
-                    f.write(entry)
+                f.write(kept)
             os.replace(TESTED_BIN_FILE + '.tmp', TESTED_BIN_FILE)
 
     except Exception:
@@ -320,55 +619,81 @@ def get_storage_stats() -> Dict[str, int]:
     }
 
     # Text file stats
-    if os.path.exists(TESTED_FILE):
-        stats['text_file_size'] = os.path.getsize(TESTED_FILE)
-        try:
-            with open(TESTED_FILE, 'r', encoding='utf-8', errors='ignore') as f:
-                lines = [line.strip() for line in f if line.strip()]
-                stats['text_entries'] = len(lines)
-                stats['unique_hashes'] = len(set(lines))
-        except Exception:
-            pass
+    try:
+        with open(TESTED_FILE, 'r', encoding='utf-8', errors='ignore') as f:
+            stats['text_file_size'] = os.fstat(f.fileno()).st_size
+            lines = [line.strip() for line in f if line.strip()]
+            stats['text_entries'] = len(lines)
+            stats['unique_hashes'] = len(set(lines))
+    except Exception:
+        pass
 
     # Binary file stats
-    if os.path.exists(TESTED_BIN_FILE):
+    try:
         stats['binary_file_size'] = os.path.getsize(TESTED_BIN_FILE)
         stats['binary_entries'] = stats['binary_file_size'] // 28  # 28 bytes per entry
+    except OSError:
+        pass
 
     return stats
 
 
-def get_current_tested_file() -> str:
-    """Get the current active tested file (tested.txt, tested_1.txt, tested_2.txt, etc.)."""
-    state_dir = os.path.dirname(TESTED_FILE)
-    base_name = os.path.basename(TESTED_FILE)  # "tested.txt"
+# Rotation state from a single directory scan, reused until rotate_tested_file() moves it on;
+# 'last_num' is the parsed number of the newest file, so rotation never re-parses a name
+_rotation_state: Dict[str, Any] = {'all': None, 'last_num': 0}
+
+
+def _tested_file_number(path: str) -> int:
+    name = os.path.basename(path)
+    return int(name.split('_')[1].split('.')[0]) if '_' in name else 0
+
+
+def _tested_files_state() -> List[str]:
+    if _rotation_state['all'] is None:
+        state_dir = os.path.dirname(TESTED_FILE)
+        tested_files = []
+        try:
+            with os.scandir(state_dir) as it:
+                for entry in it:
+                    name = entry.name
+                    if not name.startswith("tested") or not entry.is_file():
+                        continue
+                    # Appends go to the .bin companion, so a rotated file may exist only as
+                    # tested_N.txt.bin; both name the same logical tested_N.txt
+                    if name.endswith(".txt"):
+                        tested_files.append(entry.path)
+                    elif name.endswith(".txt.bin"):
+                        tested_files.append(entry.path[:-len(".bin")])
+        except FileNotFoundError:
+            pass
+        # tested.txt first, then tested_1.txt, tested_2.txt, etc.; each name parsed once
+        decorated = sorted((_tested_file_number(p), p) for p in set(tested_files))
+        _rotation_state['all'] = [p for _, p in decorated]
+        _rotation_state['last_num'] = decorated[-1][0] if decorated else 0
+    return _rotation_state['all']
 
-    # Find all tested files
-    tested_files = []
-    if os.path.exists(state_dir):
-        for file in os.listdir(state_dir):
-            if file.startswith("tested") and file.endswith(".txt"):
-                tested_files.append(file)
 
+def get_current_tested_file() -> str:
+    """Get the current active tested file (tested.txt, tested_1.txt, tested_2.txt, etc.)."""
+    tested_files = _tested_files_state()
     if not tested_files:
         # No files exist, return the base file
         return TESTED_FILE
+    # The last (highest numbered) file
+    return tested_files[-1]
 
-    # Sort files to find the highest numbered one
-    tested_files.sort(key=lambda x: int(x.split('_')[1].split('.')[0]) if '_' in x else 0)
 
-    # Get the last (highest numbered) file
-    current_file = tested_files[-1]
-    return os.path.join(state_dir, current_file)
+def _tested_file_size(path: str) -> int:
+    """Size rotation goes by: that of the .bin companion appends are written to (0 if none)."""
+    try:
+        return os.path.getsize(path + '.bin')
+    except OSError:
+        return 0
 
 
 def should_rotate_tested_file(max_size_mb: int = 50) -> bool:
-    """Check if current tested file should be rotated based on size."""
-    current_file = get_current_tested_file()
-    if not os.path.exists(current_file):
-        return False
-    size_mb = os.path.getsize(current_file) / (1024 * 1024)
-    return size_mb >= max_size_mb
+    """Check if current tested file should be rotated based on the size of its .bin file."""
+    return _tested_file_size(get_current_tested_file()) / (1024 * 1024) >= max_size_mb
 
 
 def rotate_tested_file() -> str:
@@ -379,28 +704,21 @@ def rotate_tested_file() -> str:
 
     # Determine next file number
     if current_file == TESTED_FILE:
+        next_num = 1
         next_file = os.path.join(state_dir, "tested_1.txt")
     else:
-        # Extract number from current file (e.g., "tested_2.txt" -> 2)
-        current_num = int(os.path.basename(current_file).split('_')[1].split('.')[0])
-        next_num = current_num + 1
+        # Number of the current file (e.g., "tested_2.txt" -> 2), parsed during the scan
+        next_num = _rotation_state['last_num'] + 1
         next_file = os.path.join(state_dir, f"tested_{next_num}.txt")
 
+    tested_files = _tested_files_state()
+    if next_file not in tested_files:
+        tested_files.append(next_file)
+        _rotation_state['last_num'] = next_num
     print(f"Rotated to new file: {os.path.basename(next_file)}")
     return next_file
 
 
 def get_all_tested_files() -> List[str]:
     """Get all tested files in order (tested.txt, tested_1.txt, tested_2.txt, etc.)."""
-    state_dir = os.path.dirname(TESTED_FILE)
-    tested_files = []
-
-    if os.path.exists(state_dir):
-        for file in os.listdir(state_dir):
-            if file.startswith("tested") and file.endswith(".txt"):
-                tested_files.append(os.path.join(state_dir, file))
-
-    # Sort files by number (tested.txt first, then tested_1.txt, tested_2.txt, etc.)
-    tested_files.sort(key=lambda x: int(os.path.basename(x).split('_')[1].split('.')[0]) if '_' in os.path.basename(x) else 0)
-
-    return tested_files
+    return list(_tested_files_state())
@@ -1,70 +1,102 @@
 from __future__ import annotations
 
 import concurrent.futures
+import contextlib
 import os
 import time
-from typing import Dict, List, Optional, Set, Tuple
+from typing import Dict, List, Optional, Tuple
 
-from .common import log, progress, sha1_hex
+from .bloom import ScalableBloomFilter
+from .common import _io_workers, log, progress
 from .constants import (
     AVAILABLE_FILE,
+    GROUPED_RUNS_FILE,
     CONSECUTIVE_REQUIRED,
     FETCH_WORKERS,
     FETCH_TIMEOUT,
     PING_WORKERS,
     SOURCES_FILE,
     ENABLE_STAGE2,
+    ASYNC_STAGE2,
     ENABLE_STAGE3,
     STAGE3_MAX,
     OUTPUT_DIR,
     STAGE3_WORKERS,
     NEW_URIS_LIMIT_ENABLED,
     NEW_URIS_LIMIT,
+    CONNECTIVITY_TIMEOUT,
 )
 from .geo import _build_country_counters, _country_flag
-from .grouping import regroup_available_by_country, write_grouped_outputs
+from .grouping import append_grouped, regroup_available_by_country, write_grouped_outputs
 from .io_ops import (
     append_lines,
     ensure_dirs,
     load_existing_available,
     load_streaks,
     load_tested_hashes,
-    load_tested_hashes_optimized,
+    load_tested_hash_bytes,
     append_tested_hashes_optimized,
     read_lines,
     save_streaks,
+    write_text_file_atomic,
 )
-from .net import _get_country_code_for_host, ping_host, connect_host_port, quick_protocol_probe, validate_with_v2ray_core, fetch_urls_async_batch, get_country_codes_batch, check_one_sync, is_dynamic_host, check_pair
+from .net import _get_country_code_for_host, ping_host, connect_host_port, quick_protocol_probe, fetch_urls_async_batch, get_country_codes_batch, check_one_sync, is_dynamic_host, check_pair, check_pairs_async
 from .parsing import (
+    _extract_our_cc_and_num_from_uri,
     _set_remark,
+    check_target,
     extract_host,
-    extract_port,
-    extract_uris,
-    maybe_decode_subscription,
+    parse_and_hash,
     parse_source_line,
 )
+from .rate import PROBE_BUCKET
+from .v2ray_pool import V2RayPool
 
 
 def _has_connectivity() -> bool:
-    """Best-effort Internet connectivity check using IP-only probes to avoid DNS dependency."""
+    """Best-effort Internet connectivity check using IP-only probes to avoid DNS dependency.
+
+    Every probe starts at once and the first success answers, so a slow target
+    no longer delays the others.
+    """
+    probes = [('1.1.1.1', 443), ('8.8.8.8', 53)]
+    pool = concurrent.futures.ThreadPoolExecutor(max_workers=2 * len(probes))
     try:
-        probes = [('1.1.1.1', 443), ('8.8.8.8', 53)]
-        for ip, port in probes:
-            try:
-                if ping_host(ip):
-                    return True
-            except Exception:
-                pass
+        futs = [pool.submit(ping_host, ip) for ip, _ in probes]
+        futs += [pool.submit(connect_host_port, ip, port) for ip, port in probes]
+        for fut in concurrent.futures.as_completed(futs, timeout=CONNECTIVITY_TIMEOUT):
             try:
-                if connect_host_port(ip, port):
+                if fut.result():
                     return True
             except Exception:
                 pass
     except Exception:
+        # including as_completed's timeout: nothing answered in time
         return False
+    finally:
+        # Return without waiting on the probes still in flight
+        pool.shutdown(wait=False, cancel_futures=True)
     return False
 
 
+def _parse_and_hash_sources(fetched: List[Tuple[str, bool]]) -> List[Tuple[List[str], List[bytes]]]:
+    """parse_and_hash over every fetched (content, hinted_base64), in source order.
+
+    Decoding, URI extraction and hashing are CPU-bound, so large batches fan out
+    to a process pool; small ones (or a pool failure) run inline.
+    """
+    cpus = os.cpu_count() or 1
+    if cpus > 1 and len(fetched) > 1 and sum(len(c) for c, _ in fetched) >= (8 << 20):
+        try:
+            contents = [c for c, _ in fetched]
+            hints = [b for _, b in fetched]
+            with concurrent.futures.ProcessPoolExecutor(max_workers=cpus) as pool:
+                return list(pool.map(parse_and_hash, contents, hints))
+        except Exception as e:
+            log(f"Parallel parsing failed; parsing sources sequentially: {e}")
+    return [parse_and_hash(c, b) for c, b in fetched]
+
+
 def main() -> int:
     ensure_dirs()
     if not os.path.exists(SOURCES_FILE):
@@ -88,31 +120,30 @@ def main() -> int:
     do_recheck = recheck_env not in ('0', 'false', 'no')
     alive: List[str] = []
     host_map_existing: Dict[str, Optional[str]] = {}
+    available_pruned = False
     if do_recheck and os.path.exists(AVAILABLE_FILE):
         existing_lines = [ln.strip() for ln in read_lines(AVAILABLE_FILE) if ln.strip()]
         if existing_lines:
             from .parsing import extract_host as _extract_host_for_existing
 
             host_map_existing = {u: _extract_host_for_existing(u) for u in existing_lines}
-            items = [(u, h) for u, h in host_map_existing.items() if h]
-            # initialize to False for tested hosts
-            for _, h in items:
-                if h not in host_success_run:
-                    host_success_run[h] = False
+            # Scheme and port parsed once here, not inside every check
+            items = [check_target(u, h) for u, h in host_map_existing.items() if h]
+            # initialize to False for tested hosts (one C-level build, first-seen order)
+            host_success_run = dict.fromkeys((t[1] for t in items), False)
 
-            def check_existing(item: Tuple[str, str]) -> Optional[str]:
-                u, h = item
+            def check_existing(item: Tuple[str, str, Optional[int], bool]) -> Optional[str]:
+                u, h, p, needs_tcp = item
 
                 def _check_proxy_operation():
                     try:
                         # Quick ping check with very short timeout
                         if not ping_host(h):
                             return None
-                        scheme = u.split('://', 1)[0].lower()
-                        if scheme in ('vmess', 'vless', 'trojan', 'ss', 'ssr'):
-                            p = extract_port(u)
+                        if needs_tcp:
                             if p is not None:
-                                # Connect check with short timeout
+                                # Connect check with short timeout, paced by the shared bucket
+                                PROBE_BUCKET.take()
                                 ok = connect_host_port(h, int(p))
                                 if not ok:
                                     return None
@@ -150,9 +181,15 @@ def main() -> int:
 
                 return result[0]
 
-            with concurrent.futures.ThreadPoolExecutor(max_workers=PING_WORKERS) as pool:
+            # The async checker runs its own event loop; only the threaded path needs a pool
+            use_async = int(ASYNC_STAGE2) == 1
+            with (contextlib.nullcontext() if use_async else concurrent.futures.ThreadPoolExecutor(max_workers=_io_workers(len(items), PING_WORKERS))) as pool:
                 print("Start Stage 2 for existing proxies")
-                for res in progress(pool.map(check_existing, items), total=len(items)):
+                if use_async:
+                    results = (u if ok else None for u, _, ok in check_pairs_async(items))
+                else:
+                    results = pool.map(check_existing, items)
+                for res in progress(results, total=len(items)):
                     if res is not None:
                         alive.append(res)
                         h = host_map_existing.get(res)
@@ -171,47 +208,42 @@ def main() -> int:
                     log("Stage 3 enabled, but V2Ray/Xray core not found or OPENRAY_V2RAY_CORE is not set; skipping core validation for existing proxies.")
                 else:
                     subset = alive # [:int(STAGE3_MAX)]
-                    kept_subset: List[str] = []
-
-                    def _core_check(u: str) -> Optional[str]:
-                        try:
-                            res = validate_with_v2ray_core(u, timeout_s=12)
-                        except Exception:
-                            return None
-                        return u if res is True else None
-
-                    workers = int(STAGE3_WORKERS)
-                    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as pool2:
-                        print("Start Stage 3 for existing proxies")
-                        for r in progress(pool2.map(_core_check, subset), total=len(subset)):
-                            if r is not None:
-                                kept_subset.append(r)
-                    # Merge: replace subset portion with validated ones
-                    alive = kept_subset + alive[len(subset):]
+                    print("Start Stage 3 for existing proxies")
+                    validated = set()
+                    for u, ok in progress(V2RayPool(int(STAGE3_WORKERS)).validate_many(subset), total=len(subset)):
+                        if ok:
+                            validated.add(u)
+                    # Keep the original order; pairs arrive in completion order
+                    kept_subset = [u for u in subset if u in validated]
+                    # Merge: replace subset portion with validated ones. subset is the whole list while
+                    # the [:STAGE3_MAX] cap stays commented out, so no copy of the unverified tail is needed
+                    if subset is alive:
+                        alive = kept_subset
+                    else:
+                        alive[:len(subset)] = kept_subset
 
             if len(alive) != len(existing_lines):
                 # Outage-safe guard: avoid purging available file if connectivity appears down
                 if len(existing_lines) > 0 and len(alive) == 0 and not _has_connectivity():
                     log("Suspected Internet outage during revalidation; keeping existing available proxies file unchanged.")
                 else:
-                    tmp_path = AVAILABLE_FILE + '.tmp'
-                    with open(tmp_path, 'w', encoding='utf-8', errors='ignore') as f:
-                        for u in alive:
-                            f.write(u)
-                            f.write('\n')
-                    os.replace(tmp_path, AVAILABLE_FILE)
+                    write_text_file_atomic(AVAILABLE_FILE, alive, fsync=True)
+                    available_pruned = True
                     log(f"Revalidated existing available proxies: kept {len(alive)} of {len(existing_lines)}")
             else:
                 log("Revalidated existing available proxies: all still reachable")
 
     # Load persistence early to filter as we parse
-    tested_hashes = load_tested_hashes_optimized()
+    tested_hashes = load_tested_hash_bytes()
     existing_available = load_existing_available()
 
     # Fetch and process sources concurrently; deduplicate URIs and collect only new ones
-    seen_uri: Set[str] = set()
+    # Cross-source dedup keyed by the URI digests; a false positive (~1e-6) only
+    # defers one new URI to a later run
+    seen_uri = ScalableBloomFilter()
+    unique_count = 0
     new_uris: List[str] = []
-    new_hashes: List[str] = []
+    new_hashes: List[bytes] = []
     fetched_count = 0
     # Parse sources and fetch asynchronously using aiohttp (fallbacks built-in)
     parsed_sources = []
@@ -234,23 +266,32 @@ def main() -> int:
         for u in _progress(urls_only, total=len(urls_only)):
             content_map[u] = _fetch_url_sync(u)
 
+    fetched: List[Tuple[str, bool]] = []
     for (url, flags) in parsed_sources:
         content = content_map.get(url)
         if content is None:
             continue
         fetched_count += 1
-        decoded = maybe_decode_subscription(content, hinted_base64=flags.get('base64', False))
-        for u in extract_uris(decoded):
-            if u in seen_uri:
-                continue
-            seen_uri.add(u)
-            h = sha1_hex(u)
-            if h not in tested_hashes:
-                new_uris.append(u)
-                new_hashes.append(h)
+        fetched.append((content, flags.get('base64', False)))
+
+    # Per source, as a batch: URIs (already unique within the source) not seen in an
+    # earlier source, then one vectorized Bloom check over their digests
+    for uris, hashes in _parse_and_hash_sources(fetched):
+        fresh = [i for i, seen in enumerate(seen_uri.contains_many(hashes)) if not seen]
+        if not fresh:
+            continue
+        fresh_uris = [uris[i] for i in fresh]
+        fresh_hashes = [hashes[i] for i in fresh]
+        seen_uri.update(fresh_hashes)
+        unique_count += len(fresh)
+        # Straight exact-set lookups: measured faster than a Bloom pre-check (which only
+        # adds work when the exact set is in memory anyway) or a per-source set difference
+        novel = [i for i, h in enumerate(fresh_hashes) if h not in tested_hashes]
+        new_uris.extend([fresh_uris[i] for i in novel])
+        new_hashes.extend([fresh_hashes[i] for i in novel])
 
     log(f"Fetched {fetched_count} contents")
-    log(f"Extracted {len(seen_uri)} unique proxy URIs; new to test: {len(new_uris)}")
+    log(f"Extracted {unique_count} unique proxy URIs; new to test: {len(new_uris)}")
 
     # Optionally limit the number of new URIs processed per run
     try:
@@ -269,14 +310,14 @@ def main() -> int:
     host_map: Dict[str, Optional[str]] = {}
     for u in new_uris:
         host_map[u] = extract_host(u)
-    to_test = [(u, host) for u, host in host_map.items() if host]
+    to_test = [check_target(u, host) for u, host in host_map.items() if host]
     log(f"New proxies with resolvable hosts: {len(to_test)}")
 
     # Stage 2 for new proxies: prefilter via fast batch ping, then connect/probe using asyncio or multiprocessing for large sets
     available_to_add: List[str] = []
 
-    def check_one(item: Tuple[str, str]) -> Tuple[str, str, bool]:
-        uri, host = item
+    def check_one(item: Tuple[str, str, Optional[int], bool]) -> Tuple[str, str, bool]:
+        uri, host, p, needs_tcp = item
 
         def _check_new_proxy_operation():
             try:
@@ -284,10 +325,9 @@ def main() -> int:
                 if not ping_host(host):
                     return (uri, host, False)
                 # Then, for TCP-based schemes, also ensure we can connect to the specific port
-                scheme = uri.split('://', 1)[0].lower()
-                if scheme in ('vmess', 'vless', 'trojan', 'ss', 'ssr'):
-                    p = extract_port(uri)
+                if needs_tcp:
                     if p is not None:
+                        PROBE_BUCKET.take()
                         ok2 = connect_host_port(host, int(p))
                         if ok2 and int(ENABLE_STAGE2) == 1:
                             ok2 = quick_protocol_probe(uri, host, int(p))
@@ -320,9 +360,14 @@ def main() -> int:
 
         return result[0] if result[0] else (uri, host, False)
 
-    with concurrent.futures.ThreadPoolExecutor(max_workers=PING_WORKERS) as pool:
+    use_async = int(ASYNC_STAGE2) == 1
+    with (contextlib.nullcontext() if use_async else concurrent.futures.ThreadPoolExecutor(max_workers=_io_workers(len(to_test), PING_WORKERS))) as pool:
         print("Start Stage 2 for new proxies")
-        for uri, host, ok in progress(pool.map(check_one, to_test), total=len(to_test)):
+        if use_async:
+            stage2_results = check_pairs_async(to_test)
+        else:
+            stage2_results = pool.map(check_one, to_test)
+        for uri, host, ok in progress(stage2_results, total=len(to_test)):
             # Mark host as tested this run
             if host not in host_success_run:
                 host_success_run[host] = False
@@ -344,23 +389,19 @@ def main() -> int:
             log("Stage 3 enabled, but V2Ray/Xray core not found or OPENRAY_V2RAY_CORE is not set; skipping core validation.")
         else:
             subset = available_to_add # [:int(STAGE3_MAX)]
-            kept_subset: List[str] = []
-
-            def _core_check(u: str) -> Optional[str]:
-                try:
-                    res = validate_with_v2ray_core(u, timeout_s=12)
-                except Exception:
-                    return None
-                return u if res is True else None
-
-            workers = int(STAGE3_WORKERS)
-            with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as pool2:
-                print("Start Stage 3 for new proxies")
-                for r in progress(pool2.map(_core_check, subset), total=len(subset)):
-                    if r is not None:
-                        kept_subset.append(r)
-            # Merge: replace subset portion with validated ones
-            available_to_add = kept_subset + available_to_add[len(subset):]
+            print("Start Stage 3 for new proxies")
+            validated = set()
+            for u, ok in progress(V2RayPool(int(STAGE3_WORKERS)).validate_many(subset), total=len(subset)):
+                if ok:
+                    validated.add(u)
+            # Keep the original order; pairs arrive in completion order
+            kept_subset = [u for u in subset if u in validated]
+            # Merge: replace subset portion with validated ones. subset is the whole list while
+            # the [:STAGE3_MAX] cap stays commented out, so no copy of the unverified tail is needed
+            if subset is available_to_add:
+                available_to_add = kept_subset
+            else:
+                available_to_add[:len(subset)] = kept_subset
 
     # Deduplicate against existing available file and write
     new_available_unique: List[str] = []
@@ -370,6 +411,8 @@ def main() -> int:
             exists_set.add(u)
             new_available_unique.append(u)
 
+    # New entries keyed the way write_grouped_outputs() files them (XX without our country remark)
+    by_cc: Dict[str, List[str]] = {}
     if new_available_unique:
         # Build per-country counters from existing entries
         counters = _build_country_counters(existing_available)
@@ -393,29 +436,46 @@ def main() -> int:
                     cc_map[h] = _get_country_code_for_host(h)
                 except Exception:
                     cc_map[h] = None
+        # Dynamic status (DNS heuristic, no streaks used) needs a lookup per host: resolve
+        # every unique host concurrently up front instead of one at a time in the loop
+        dynamic_by_host: Dict[str, bool] = {}
+        if hosts_to_resolve:
+            with concurrent.futures.ThreadPoolExecutor(max_workers=_io_workers(len(hosts_to_resolve), PING_WORKERS)) as pool:
+                dynamic_by_host = dict(zip(hosts_to_resolve, pool.map(is_dynamic_host, hosts_to_resolve)))
+        flag_by_cc = {cc: _country_flag(cc) for cc in {c for c in cc_map.values() if c} | {'XX'}}
         for u in progress(new_available_unique, total=len(new_available_unique)):
             host = host_map.get(u)
             cc = cc_map.get(host) if host else None
             if not cc:
                 cc = 'XX'
-            flag = _country_flag(cc)
+            flag = flag_by_cc[cc]
             next_num = counters.get(cc, 0) + 1
             counters[cc] = next_num
-            # Determine dynamic status using DNS heuristic (no streaks used)
-            is_dynamic = True if not host else is_dynamic_host(host)
+            is_dynamic = dynamic_by_host.get(host, True) if host else True
             if is_dynamic:
                 remark = f"[OpenRay] Dynamic-{next_num}"
             else:
                 remark = f"[OpenRay] {flag} {cc}-{next_num}"
             new_u = _set_remark(u, remark)
             formatted_to_append.append(new_u)
+            parsed_cc = _extract_our_cc_and_num_from_uri(new_u)
+            by_cc.setdefault(parsed_cc[0] if parsed_cc else 'XX', []).append(new_u)
         append_lines(AVAILABLE_FILE, formatted_to_append)
         log(f"Appended {len(formatted_to_append)} new available proxies to {AVAILABLE_FILE} with formatted remarks")
     else:
         log("No new available proxies to append (all duplicates)")
 
-    # Regroup available proxies by country
-    regroup_available_by_country()
+    # Grouped outputs: a pruned available file needs the full regroup/rewrite; otherwise
+    # new entries are only appended, with a full pass every GROUPED_FULL_EVERY runs
+    if available_pruned:
+        grouped_full = True
+    elif by_cc:
+        grouped_full = not append_grouped(by_cc)
+    else:
+        grouped_full = not os.path.exists(GROUPED_RUNS_FILE)
+    regrouped: Optional[List[str]] = None
+    if grouped_full:
+        regrouped = regroup_available_by_country()
 
     # Optional: export v2ray/xray JSON configs for available proxies
     try:
@@ -447,24 +507,32 @@ def main() -> int:
             log("Suspected Internet outage affected tests; skipping streaks update to avoid false resets.")
         else:
             now_ts = int(time.time())
+            # load_streaks() already yields int fields: update records in place and only
+            # allocate one for hosts seen for the first time
+            get_rec = streaks.get
             for host, success in host_success_run.items():
-                rec = streaks.get(host, {'streak': 0, 'last_test': 0, 'last_success': 0})
-                rec['last_test'] = now_ts
-                if success:
-                    rec['streak'] = int(rec.get('streak', 0)) + 1
-                    rec['last_success'] = now_ts
+                rec = get_rec(host)
+                if rec is None:
+                    streaks[host] = {'streak': 1 if success else 0, 'last_test': now_ts,
+                                     'last_success': now_ts if success else 0}
+                elif success:
+                    rec['streak'] = rec.get('streak', 0) + 1
+                    rec['last_test'] = rec['last_success'] = now_ts
                 else:
                     rec['streak'] = 0
-                streaks[host] = rec
+                    rec['last_test'] = now_ts
             save_streaks(streaks)
     except Exception as e:
         log(f"Streaks update failed: {e}")
 
     # Generate grouped outputs by kind and country
-    try:
-        write_grouped_outputs()
-    except Exception as e:
-        log(f"Grouped outputs step failed: {e}")
+    if grouped_full:
+        try:
+            write_grouped_outputs(regrouped)
+        except Exception as e:
+            log(f"Grouped outputs step failed: {e}")
+    else:
+        log(f"Appended new available proxies to {len(by_cc)} country groups (no full regroup this run)")
 
     return 0
 
@@ -1,11 +1,14 @@
 from __future__ import annotations
 
 import concurrent.futures
+import contextlib
 import os
+import random
+import socket
 import time
 from typing import Dict, List, Optional, Set, Tuple
 
-from .common import log, progress, sha1_hex
+from .common import _io_workers, log, progress, sha1_hex
 from .constants import (
     AVAILABLE_FILE,
     PING_WORKERS,
@@ -13,43 +16,71 @@ from .constants import (
     ENABLE_STAGE3,
     STAGE3_MAX,
     STAGE3_WORKERS,
+    CONNECTIVITY_TIMEOUT,
+    TRUST_STREAK,
+    TRUST_WINDOW,
+    TRUST_SAMPLE_PCT,
 )
+from . import dns_cache
 from .grouping import write_grouped_outputs
 from .io_ops import (
+    _read_lines_if_exists,
+    append_streak_deltas,
     ensure_dirs,
     load_streaks,
-    read_lines,
-    save_streaks,
+    write_text_file_atomic,
 )
-from .net import ping_host, connect_host_port, quick_protocol_probe, validate_with_v2ray_core
+from .net import ping_host, ping_hosts_once, connect_host_port, quick_protocol_probe
 from .parsing import (
-    extract_host,
-    extract_port,
+    check_target,
+    extract_hosts_bulk,
 )
+from .rate import PROBE_BUCKET
+from .v2ray_pool import V2RayPool
+
+
+def _tcp_probe(ip: str, port: int) -> bool:
+    with socket.create_connection((ip, port), timeout=CONNECTIVITY_TIMEOUT):
+        return True
 
 
 def _has_connectivity() -> bool:
-    """Best-effort Internet connectivity check using IP-only probes to avoid DNS dependency."""
+    """Best-effort Internet connectivity check using IP-only probes to avoid DNS dependency.
+
+    Every probe starts at once and the first success answers, so a slow target
+    no longer delays the others.
+    """
+    probes = [('1.1.1.1', 443), ('8.8.8.8', 53)]
+    pool = concurrent.futures.ThreadPoolExecutor(max_workers=2 * len(probes))
     try:
-        probes = [('1.1.1.1', 443), ('8.8.8.8', 53)]
-        for ip, port in probes:
-            try:
-                if ping_host(ip):
-                    return True
-            except Exception:
-                pass
+        futs = [pool.submit(ping_host, ip) for ip, _ in probes]
+        futs += [pool.submit(_tcp_probe, ip, port) for ip, port in probes]
+        for fut in concurrent.futures.as_completed(futs, timeout=CONNECTIVITY_TIMEOUT):
             try:
-                if connect_host_port(ip, port):
+                if fut.result():
                     return True
             except Exception:
                 pass
     except Exception:
+        # including as_completed's timeout: nothing answered in time
         return False
+    finally:
+        # Return without waiting on the probes still in flight
+        pool.shutdown(wait=False, cancel_futures=True)
     return False
 
 
+def _discard(path: str) -> None:
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
 def main() -> int:
     ensure_dirs()
+    # Every URI check resolves its host again; answer repeats from memory
+    dns_cache.install()
     
     # Pre-flight connectivity check to avoid destructive actions during outages
     if not _has_connectivity():
@@ -61,51 +92,91 @@ def main() -> int:
 
     # Re-validate current available proxies to drop broken ones
     host_success_run: Dict[str, bool] = {}
+    alive_count = 0
     alive: List[str] = []
     host_map_existing: Dict[str, Optional[str]] = {}
     
-    if os.path.exists(AVAILABLE_FILE):
-        existing_lines = [ln.strip() for ln in read_lines(AVAILABLE_FILE) if ln.strip()]
+    existing_lines = _read_lines_if_exists(AVAILABLE_FILE)
+    if existing_lines is not None:
         if existing_lines:
-            from .parsing import extract_host as _extract_host_for_existing
-
-            host_map_existing = {u: _extract_host_for_existing(u) for u in existing_lines}
+            host_map_existing = dict(zip(existing_lines, extract_hosts_bulk(existing_lines)))
             items = [(u, h) for u, h in host_map_existing.items() if h]
-            # initialize to False for tested hosts
-            for _, h in items:
-                if h not in host_success_run:
-                    host_success_run[h] = False
 
-            def check_existing(item: Tuple[str, str]) -> Optional[str]:
-                u, h = item
+            # Optimistic revalidation: a host on a long success streak with a recent success keeps
+            # its URIs without ping/port checks, except a random TRUST_SAMPLE_PCT re-checked anyway.
+            # Trusted hosts are not "tested", so their last_success ages out of the window and
+            # forces a real check at the latest TRUST_WINDOW seconds later.
+            trusted: Set[str] = set()
+            if int(TRUST_STREAK) > 0:
+                now_ts = time.time()
+                for h in {h for _, h in items}:
+                    rec = streaks.get(h)
+                    if (rec and rec.get('streak', 0) >= TRUST_STREAK
+                            and now_ts - rec.get('last_success', 0) < TRUST_WINDOW
+                            and random.random() * 100 >= TRUST_SAMPLE_PCT):
+                        trusted.add(h)
+                if trusted:
+                    log(f"Trusting {len(trusted)} hosts on recent success streaks; skipping their re-check")
+
+            # initialize to False for tested hosts (one C-level build, first-seen order)
+            host_success_run = dict.fromkeys((h for _, h in items if h not in trusted), False)
+
+            # One ping per distinct host; only URIs on reachable hosts go on to the port checks
+            print("Start ping for existing proxy hosts")
+            ping_ok = ping_hosts_once(host_success_run)
+            # Scheme and port are parsed once here, not in every worker call
+            port_items = [check_target(u, h) for u, h in items if h in trusted or ping_ok.get(h)]
+            stage2 = int(ENABLE_STAGE2) == 1
+
+            def check_existing(item: Tuple[str, str, Optional[int], bool]) -> Optional[str]:
+                u, h, p, needs_tcp = item
+                if h in trusted:
+                    return u
                 try:
-                    if not ping_host(h):
-                        return None
-                    scheme = u.split('://', 1)[0].lower()
-                    if scheme in ('vmess', 'vless', 'trojan', 'ss', 'ssr'):
-                        p = extract_port(u)
-                        if p is not None:
-                            ok = connect_host_port(h, int(p))
-                            if not ok:
-                                return None
-                            if int(ENABLE_STAGE2) == 1:
-                                return u if quick_protocol_probe(u, h, int(p)) else None
-                            return u
+                    if needs_tcp and p is not None:
+                        PROBE_BUCKET.take()
+                        if not connect_host_port(h, p):
+                            return None
+                        if stage2:
+                            return u if quick_protocol_probe(u, h, p) else None
                     return u
                 except Exception:
                     return None
 
-            with concurrent.futures.ThreadPoolExecutor(max_workers=PING_WORKERS) as pool:
+            # Survivors stream straight into the replacement file; `alive` only references existing_lines
+            tmp_path = AVAILABLE_FILE + '.tmp'
+            alive_count = 0
+            with contextlib.ExitStack() as stack:
+                out = stack.enter_context(open(tmp_path, 'w', encoding='utf-8', errors='ignore'))
+                pool = stack.enter_context(concurrent.futures.ThreadPoolExecutor(max_workers=_io_workers(len(port_items), PING_WORKERS)))
                 print("Start Stage 2 for existing proxies")
-                for res in progress(pool.map(check_existing, items), total=len(items)):
-                    if res is not None:
+                fut_to_idx = {pool.submit(check_existing, it): i for i, it in enumerate(port_items)}
+                # Drain in completion order so a slow host doesn't hold up the rest; results
+                # wait in `done` only until the earlier ones arrive, keeping the file order
+                done: Dict[int, Optional[str]] = {}
+                next_idx = 0
+                for fut in progress(concurrent.futures.as_completed(fut_to_idx), total=len(fut_to_idx)):
+                    i = fut_to_idx[fut]
+                    try:
+                        done[i] = fut.result()
+                    except Exception as e:
+                        log(f"Stage 2 check failed for {port_items[i][0]}: {e}")
+                        done[i] = None
+                    while next_idx in done:
+                        res = done.pop(next_idx)
+                        next_idx += 1
+                        if res is None:
+                            continue
+                        out.write(res)
+                        out.write('\n')
                         alive.append(res)
+                        alive_count += 1
                         h = host_map_existing.get(res)
-                        if h:
+                        if h in host_success_run:
                             host_success_run[h] = True
 
             # Optional Stage 3: validate a subset of revalidated existing proxies with V2Ray core (if configured)
-            if int(ENABLE_STAGE3) == 1 and alive:
+            if int(ENABLE_STAGE3) == 1 and alive_count:
                 core_path = ''
                 try:
                     from .constants import V2RAY_CORE_PATH  # local import to avoid circulars in some contexts
@@ -116,37 +187,34 @@ def main() -> int:
                     log("Stage 3 enabled, but V2Ray/Xray core not found or OPENRAY_V2RAY_CORE is not set; skipping core validation for existing proxies.")
                 else:
                     subset = alive # [:int(STAGE3_MAX)]
-                    kept_subset: List[str] = []
-
-                    def _core_check(u: str) -> Optional[str]:
-                        try:
-                            res = validate_with_v2ray_core(u, timeout_s=12)
-                        except Exception:
-                            return None
-                        return u if res is True else None
-
-                    workers = int(STAGE3_WORKERS)
-                    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as pool2:
-                        print("Start Stage 3 for existing proxies")
-                        for r in progress(pool2.map(_core_check, subset), total=len(subset)):
-                            if r is not None:
-                                kept_subset.append(r)
-                    # Merge: replace subset portion with validated ones
-                    alive = kept_subset + alive[len(subset):]
-
-            if len(alive) != len(existing_lines):
+                    validated: Set[str] = set()
+
+                    # Long-lived core processes, each serving a batch of URIs; results in completion order
+                    print("Start Stage 3 for existing proxies")
+                    pool3 = V2RayPool(_io_workers(len(subset), STAGE3_WORKERS))
+                    for u, ok in progress(pool3.validate_many(subset), total=len(subset)):
+                        if ok:
+                            validated.add(u)
+                    kept_subset = [u for u in subset if u in validated]
+                    # Merge: replace subset portion with validated ones. subset is the whole list while
+                    # the [:STAGE3_MAX] cap stays commented out, so no copy of the unverified tail is needed
+                    if subset is alive:
+                        alive = kept_subset
+                    else:
+                        alive[:len(subset)] = kept_subset
+                    write_text_file_atomic(tmp_path, alive)
+                    alive_count = len(alive)
+
+            if alive_count != len(existing_lines):
                 # Outage-safe guard: avoid purging available file if connectivity appears down
-                if len(existing_lines) > 0 and len(alive) == 0 and not _has_connectivity():
+                if len(existing_lines) > 0 and alive_count == 0 and not _has_connectivity():
                     log("Suspected Internet outage during revalidation; keeping existing available proxies file unchanged.")
+                    _discard(tmp_path)
                 else:
-                    tmp_path = AVAILABLE_FILE + '.tmp'
-                    with open(tmp_path, 'w', encoding='utf-8', errors='ignore') as f:
-                        for u in alive:
-                            f.write(u)
-                            f.write('\n')
                     os.replace(tmp_path, AVAILABLE_FILE)
-                    log(f"Revalidated existing available proxies: kept {len(alive)} of {len(existing_lines)}")
+                    log(f"Revalidated existing available proxies: kept {alive_count} of {len(existing_lines)}")
             else:
+                _discard(tmp_path)
                 log("Revalidated existing available proxies: all still reachable")
     else:
         log(f"No existing proxies file found: {AVAILABLE_FILE}")
@@ -162,14 +230,15 @@ def main() -> int:
         else:
             streaks[host]['consecutive'] = 0
 
-    save_streaks(streaks)
+    # Only the hosts tested this run changed: journal those instead of a full rewrite
+    append_streak_deltas(streaks, host_success_run)
 
     # Group and write outputs
-    if alive:
-        # Write grouped outputs (this will read from AVAILABLE_FILE which we just updated)
-        write_grouped_outputs()
+    if alive_count:
+        # Group the in-memory list; it matches what AVAILABLE_FILE now holds
+        write_grouped_outputs(alive)
         
-        log(f"Successfully processed {len(alive)} existing proxies")
+        log(f"Successfully processed {alive_count} existing proxies")
     else:
         log("No existing proxies found to process")
 
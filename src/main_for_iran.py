@@ -1,10 +1,16 @@
 from __future__ import annotations
 
+import heapq
 import os
 from typing import List, Dict
 import socket
 import json
 
+try:
+    import orjson as _orjson  # type: ignore
+except Exception:
+    _orjson = None
+
 # Patch constants BEFORE importing modules that read them
 from . import constants as C
 
@@ -21,6 +27,7 @@ C.AVAILABLE_FILE = os.path.join(C.OUTPUT_DIR, 'all_valid_proxies_for_iran.txt')
 C.STREAKS_FILE = os.path.join(C.STATE_DIR, 'streaks.json')
 C.KIND_DIR = os.path.join(C.OUTPUT_DIR, 'kind')
 C.COUNTRY_DIR = os.path.join(C.OUTPUT_DIR, 'country')
+C.GROUPED_RUNS_FILE = os.path.join(C.STATE_DIR, 'grouped_runs.txt')
 
 # Provide an empty sources file so the main pipeline skips fetching new sources
 EMPTY_SOURCES = os.path.join(C.REPO_ROOT, 'sources_iran.txt')
@@ -32,7 +39,9 @@ TOP100_FILE = os.path.join(C.OUTPUT_DIR, 'iran_top100_checked.txt')
 
 # Now import the rest of the pipeline after patching constants
 from .common import log  # noqa: E402
-from .io_ops import ensure_dirs, read_lines, write_text_file_atomic  # noqa: E402
+from .io_ops import _read_lines_if_exists, ensure_dirs, write_text_file_atomic  # noqa: E402
+from .parsing import extract_hosts_bulk  # noqa: E402
+from . import dns_cache  # noqa: E402
 from . import main as main_pipeline  # noqa: E402
 
 
@@ -40,11 +49,14 @@ def _seed_available_from_input() -> None:
     """Seed the Iran-specific AVAILABLE_FILE with contents of INPUT_FILE (if present)."""
     try:
         ensure_dirs()
-        lines: List[str] = []
-        if os.path.exists(INPUT_FILE):
-            lines = [ln.strip() for ln in read_lines(INPUT_FILE) if ln.strip()]
-        else:
+        lines = _read_lines_if_exists(INPUT_FILE)
+        if lines is None:
+            lines = []
             log(f"Input not found: {INPUT_FILE}")
+        # The pipeline rechecks C.AVAILABLE_FILE (the seeding write below is disabled):
+        # resolve those hosts once, concurrently, into the cache
+        dns_cache.install()
+        dns_cache.prewarm(extract_hosts_bulk(_read_lines_if_exists(C.AVAILABLE_FILE) or []))
         # write_text_file_atomic(C.AVAILABLE_FILE, lines)
         # Ensure empty sources file exists so main() doesn't exit
         try:
@@ -58,33 +70,38 @@ def _seed_available_from_input() -> None:
 
 def _load_check_counts() -> Dict[str, int]:
     try:
-        if os.path.exists(CHECK_COUNTS_FILE):
-            with open(CHECK_COUNTS_FILE, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-                if isinstance(data, dict):
-                    # ensure keys are strings and values are ints
-                    return {str(k): int(v) for k, v in data.items()}
+        with open(CHECK_COUNTS_FILE, 'rb') as f:
+            raw = f.read()
+        data = None
+        if _orjson is not None:
+            try:
+                data = _orjson.loads(raw)
+            except Exception:
+                pass  # e.g. stray invalid UTF-8; the lenient json path below copes
+        if data is None:
+            data = json.loads(raw.decode('utf-8', errors='ignore'))
+        if isinstance(data, dict):
+            # ensure keys are strings and values are ints
+            return {str(k): int(v) for k, v in data.items()}
+    except FileNotFoundError:
+        pass
     except Exception as e:
         log(f"Failed to load check counts: {e}")
     return {}
 
 
-def _cleanup_check_counts(active_proxies: List[str]) -> None:
-    """Remove check counts for proxies that are no longer active."""
+def _cleanup_check_counts(active_proxies: List[str], counts: Dict[str, int]) -> int:
+    """Remove check counts for proxies that are no longer active, in place. Returns how many."""
     if not active_proxies:
-        return
+        return 0
 
-    counts = _load_check_counts()
     active_set = set(active_proxies)
-
-    # Filter counts to only include active proxies
-    cleaned_counts = {proxy: count for proxy, count in counts.items() if proxy in active_set}
-
-    # Only save if there are changes
-    if len(cleaned_counts) != len(counts):
-        removed_count = len(counts) - len(cleaned_counts)
-        log(f"Cleaned up check counts: removed {removed_count} inactive proxies")
-        _save_check_counts(cleaned_counts)
+    stale = [proxy for proxy in counts if proxy not in active_set]
+    for proxy in stale:
+        del counts[proxy]
+    if stale:
+        log(f"Cleaned up check counts: removed {len(stale)} inactive proxies")
+    return len(stale)
 
 
 def _save_check_counts(counts: Dict[str, int]) -> None:
@@ -92,17 +109,30 @@ def _save_check_counts(counts: Dict[str, int]) -> None:
         ensure_dirs()
         os.makedirs(os.path.dirname(CHECK_COUNTS_FILE), exist_ok=True)
         tmp = CHECK_COUNTS_FILE + '.tmp'
-        with open(tmp, 'w', encoding='utf-8', errors='ignore') as f:
-            json.dump(counts, f, ensure_ascii=False, indent=2)
+        # Only this script reads the file back, so it is written compact
+        blob = None
+        if _orjson is not None:
+            try:
+                # Same bytes as json.dumps(..., ensure_ascii=False, separators=(',', ':'))
+                blob = _orjson.dumps(counts)
+            except Exception:
+                blob = None
+        if blob is None:
+            blob = json.dumps(counts, ensure_ascii=False, separators=(',', ':')).encode('utf-8', errors='ignore')
+        with open(tmp, 'wb') as f:
+            f.write(blob)
         os.replace(tmp, CHECK_COUNTS_FILE)
+        if C.PRETTY_CHECK_COUNTS:
+            with open(CHECK_COUNTS_FILE + '.pretty', 'w', encoding='utf-8') as f:
+                json.dump(counts, f, ensure_ascii=False, indent=2)
     except Exception as e:
         log(f"Failed to save check counts: {e}")
 
 
-def _update_check_counts_for_proxies(proxies: List[str], active_proxies: List[str] = None) -> None:
+def _update_check_counts_for_proxies(proxies: List[str], active_proxies: List[str], counts: Dict[str, int]) -> bool:
+    """Count one more check for each proxy (only active ones when active_proxies is given), in place."""
     if not proxies:
-        return
-    counts = _load_check_counts()
+        return False
 
     # If active_proxies is provided, only update counts for active proxies
     active_set = set(active_proxies) if active_proxies else None
@@ -114,29 +144,30 @@ def _update_check_counts_for_proxies(proxies: List[str], active_proxies: List[st
         if active_set is not None and p not in active_set:
             continue
         counts[p] = int(counts.get(p, 0)) + 1
-    _save_check_counts(counts)
+    return True
 
 
-def _write_top100_by_checks(active_proxies: List[str]) -> None:
+def _write_top100_by_checks(active_proxies: List[str], counts: Dict[str, int]) -> None:
     try:
-        counts = _load_check_counts()
-        # Score each active proxy by its check count (default 0)
-        scored = [(counts.get(p, 0), idx, p) for idx, p in enumerate(active_proxies)]
-        # Sort by count desc, then by original order asc (stable tie-break)
-        scored.sort(key=lambda t: (-t[0], t[1]))
-        top = [p for _, _, p in scored[:100]]
+        # Highest check count first (default 0), ties in original order; nlargest keeps
+        # only a 100-entry heap instead of sorting every active proxy
+        get_count = counts.get
+        top = [p for _, p in heapq.nlargest(
+            100, enumerate(active_proxies), key=lambda t: (get_count(t[1], 0), -t[0]))]
         write_text_file_atomic(TOP100_FILE, top)
         log(f"Wrote top {len(top)} checked active proxies to {TOP100_FILE}")
     except Exception as e:
         log(f"Failed to write top100 checked proxies: {e}")
 
 
-def check_internet_socket(host="8.8.8.8", port=53, timeout=3):
+def check_internet_socket(host="8.8.8.8", port=53, timeout=None):
+    # Per-socket timeout; the process-wide default is left alone for later stages
+    if timeout is None:
+        timeout = C.CONNECTIVITY_TIMEOUT
     try:
-        socket.setdefaulttimeout(timeout)
-        socket.socket(socket.AF_INET, socket.SOCK_STREAM).connect((host, port))
-        return True
-    except Exception:
+        with socket.create_connection((host, port), timeout=timeout):
+            return True
+    except OSError:
         return False
 
 
@@ -144,10 +175,8 @@ def main() -> int:
     _seed_available_from_input()
 
     # Capture the list of proxies that will be rechecked by the main pipeline this run
-    pre_existing: List[str] = []
     try:
-        if os.path.exists(C.AVAILABLE_FILE):
-            pre_existing = [ln.strip() for ln in read_lines(C.AVAILABLE_FILE) if ln.strip()]
+        pre_existing: List[str] = _read_lines_if_exists(C.AVAILABLE_FILE) or []
     except Exception:
         pre_existing = []
 
@@ -156,18 +185,21 @@ def main() -> int:
     if rc == 0:
         # Build top 100 among currently active proxies
         try:
-            active_now: List[str] = []
-            if os.path.exists(C.AVAILABLE_FILE):
-                active_now = [ln.strip() for ln in read_lines(C.AVAILABLE_FILE) if ln.strip()]
+            active_now: List[str] = _read_lines_if_exists(C.AVAILABLE_FILE) or []
+
+            # Loaded once; the helpers below update it in place and it is saved once
+            counts = _load_check_counts()
 
             # Clean up check counts to only include active proxies
-            _cleanup_check_counts(active_now)
+            changed = _cleanup_check_counts(active_now, counts) > 0
 
             # After pipeline finishes, update check counts for proxies that were revalidated
             # Only update counts for proxies that are still active
-            _update_check_counts_for_proxies(pre_existing, active_now)
+            changed = _update_check_counts_for_proxies(pre_existing, active_now, counts) or changed
+            if changed:
+                _save_check_counts(counts)
 
-            _write_top100_by_checks(active_now)
+            _write_top100_by_checks(active_now, counts)
         except Exception as e:
             log(f"Active proxies processing failed: {e}")
     else:
@@ -1,64 +1,37 @@
 from __future__ import annotations
 
-import concurrent.futures
 import os
-from typing import List, Optional, Tuple
+from typing import List, Set, Tuple
 
 # Use package-relative imports to support `python -m src.main_local`
-from .constants import AVAILABLE_FILE, OUTPUT_DIR, PING_WORKERS, ENABLE_STAGE2, ENABLE_STAGE3, STAGE3_MAX  # type: ignore
-from .io_ops import ensure_dirs, read_lines, write_text_file_atomic  # type: ignore
-from .parsing import extract_host, extract_port  # type: ignore
-from .net import ping_host, connect_host_port, quick_protocol_probe, validate_with_v2ray_core  # type: ignore
-from .common import log, progress  # type: ignore
+from .constants import AVAILABLE_FILE, OUTPUT_DIR, PING_WORKERS, ENABLE_STAGE3, STAGE3_MAX  # type: ignore
+from .io_ops import _read_lines_if_exists, ensure_dirs, write_text_file_atomic  # type: ignore
+from .parsing import check_target, extract_hosts_bulk  # type: ignore
+from .net import ping_hosts_once  # type: ignore
+from .net_async import check_ports  # type: ignore
+from .v2ray_pool import V2RayPool  # type: ignore
+from .common import _io_workers, log, progress  # type: ignore
+from . import dns_cache  # type: ignore
 
 
 OUT_FILE = os.path.join(OUTPUT_DIR, 'Iran_valid_proxies.txt')
 
 
-def _check_one(item: Tuple[str, str]) -> Optional[str]:
-    """Return URI if alive, else None."""
-    uri, host = item
-    try:
-        if not host:
-            return None
-        # First, ensure host is reachable (ICMP/TCP fallback)
-        if not ping_host(host):
-            return None
-        # Then, for TCP-based schemes, also ensure we can connect to the specific port
-        scheme = uri.split('://', 1)[0].lower()
-        if scheme in ('vmess', 'vless', 'trojan', 'ss', 'ssr'):
-            p = extract_port(uri)
-            if p is not None:
-                ok = connect_host_port(host, int(p))
-                if not ok:
-                    return None
-                if int(ENABLE_STAGE2) == 1:
-                    return uri if quick_protocol_probe(uri, host, int(p)) else None
-                return uri
-        return uri
-    except Exception:
-        return None
-
-
 def main() -> int:
     ensure_dirs()
 
-    if not os.path.exists(AVAILABLE_FILE):
+    lines = _read_lines_if_exists(AVAILABLE_FILE)
+    if lines is None:
         log(f"Input not found: {AVAILABLE_FILE}")
         return 1
 
-    lines = [ln.strip() for ln in read_lines(AVAILABLE_FILE) if ln.strip()]
     if not lines:
         log("No proxies to validate.")
         write_text_file_atomic(OUT_FILE, [])
         return 0
 
-    # Build (uri, host) pairs
-    items: List[Tuple[str, str]] = []
-    for u in lines:
-        h = extract_host(u)
-        if h:
-            items.append((u, h))
+    # Build (uri, host) pairs; hosts come from one bulk pass over all lines
+    items: List[Tuple[str, str]] = [(u, h) for u, h in zip(lines, extract_hosts_bulk(lines)) if h]
 
     if not items:
         log("No resolvable hosts found among proxies.")
@@ -66,13 +39,19 @@ def main() -> int:
         return 0
 
     log(f"Checking {len(items)} proxies from {AVAILABLE_FILE} ...")
+    # Resolve each host once up front; ping, connect and probe then hit the cache
+    dns_cache.install()
+    dns_cache.prewarm(h for _, h in items)
+
+    # First, ensure hosts are reachable (ICMP/TCP fallback): one ping per distinct host
+    print("Start ping for proxy hosts")
+    ping_ok = ping_hosts_once(h for _, h in items)
+    port_items = [(u, h) for u, h in items if ping_ok.get(h)]
 
-    alive: List[str] = []
-    with concurrent.futures.ThreadPoolExecutor(max_workers=PING_WORKERS) as pool:
-        print("Start Stage 2 for existing proxies")
-        for res in progress(pool.map(_check_one, items), total=len(items)):
-            if res is not None:
-                alive.append(res)
+    # Port connects and TLS probes all run on one event loop instead of a thread each
+    print("Start Stage 2 for existing proxies")
+    targets = [check_target(u, h) for u, h in port_items]
+    alive: List[str] = [t[0] for t, ok in zip(targets, check_ports(targets)) if ok]
 
     # Optional Stage 3: validate a subset with V2Ray core (if configured)
     if int(ENABLE_STAGE3) == 1 and alive:
@@ -86,23 +65,22 @@ def main() -> int:
             log("Stage 3 enabled, but V2Ray/Xray core not found or OPENRAY_V2RAY_CORE is not set; skipping core validation.")
         else:
             subset = alive # [:int(STAGE3_MAX)]
-            kept_subset: List[str] = []
-
-            def _core_check(u: str) -> Optional[str]:
-                try:
-                    res = validate_with_v2ray_core(u, timeout_s=12)
-                except Exception:
-                    return None
-                return u if res is True else None
-
-            workers = min(int(PING_WORKERS), 16)
-            with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as pool:
-                print("Start Stage 3 for existing proxies")
-                for r in progress(pool.map(_core_check, subset), total=len(subset)):
-                    if r is not None:
-                        kept_subset.append(r)
-            # Merge: replace subset portion with validated ones
-            alive = kept_subset + alive[len(subset):]
+            validated: Set[str] = set()
+
+            # Long-lived core processes, each serving a batch of URIs
+            print("Start Stage 3 for existing proxies")
+            pool = V2RayPool(_io_workers(len(subset), min(int(PING_WORKERS), 16)))
+            for u, ok in progress(pool.validate_many(subset), total=len(subset)):
+                if ok:
+                    validated.add(u)
+            # Completion order above; keep the input order here
+            kept_subset = [u for u in subset if u in validated]
+            # Merge: replace subset portion with validated ones. subset is the whole list while
+            # the [:STAGE3_MAX] cap stays commented out, so no copy of the unverified tail is needed
+            if subset is alive:
+                alive = kept_subset
+            else:
+                alive[:len(subset)] = kept_subset
 
     # Optional: export v2ray/xray JSON configs for alive proxies
     try:
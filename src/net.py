@@ -1,5 +1,6 @@
 from __future__ import annotations
 
+import concurrent.futures
 import json
 import os
 import socket
@@ -8,12 +9,14 @@ import sys
 import ssl
 import shutil
 import tempfile
-from typing import List, Optional, Dict, Set, Tuple
+from typing import Iterable, List, Optional, Dict, Set, Tuple
 from urllib.request import Request, urlopen
 
-from .constants import USER_AGENT, PING_TIMEOUT_MS, TCP_FALLBACK_PORTS, FETCH_TIMEOUT, CONNECT_TIMEOUT_MS, PROBE_TIMEOUT_MS, V2RAY_CORE_PATH, ENABLE_STAGE2, FETCH_WORKERS, PING_WORKERS
-from .common import log, progress
-from .geo import get_country_code_geoip2
+from .constants import USER_AGENT, PING_TIMEOUT_MS, TCP_FALLBACK_PORTS, FETCH_TIMEOUT, CONNECT_TIMEOUT_MS, PROBE_TIMEOUT_MS, V2RAY_CORE_PATH, ENABLE_STAGE2, FETCH_WORKERS, PING_WORKERS, ASYNC_STAGE2_CONCURRENCY
+from .common import _io_workers, log, progress
+from .geo import get_country_code_geoip2, get_country_codes_geoip2_batch
+from .http_client import SESSION
+from .rate import PROBE_BUCKET
 
 
 def _idna(host: str) -> str:
@@ -24,15 +27,21 @@ def _idna(host: str) -> str:
 
 
 def fetch_url(url: str, timeout: int = FETCH_TIMEOUT) -> Optional[str]:
+    # limit size to 10 MB to avoid memory blowups
+    max_bytes = 10 * 1024 * 1024
     try:
-        req = Request(url, headers={'User-Agent': USER_AGENT, 'Accept': '*/*'})
-        with urlopen(req, timeout=timeout) as resp:
-            # limit size to 10 MB to avoid memory blowups
-            max_bytes = 10 * 1024 * 1024
-            data = resp.read(max_bytes + 1)
-            if len(data) > max_bytes:
-                data = data[:max_bytes]
-            return data.decode('utf-8', errors='ignore')
+        if SESSION is not None:
+            # Sources share a handful of hosts: the pooled session pays TCP/TLS setup once per host
+            with SESSION.get(url, timeout=timeout, stream=True) as resp:
+                resp.raise_for_status()
+                data = resp.raw.read(max_bytes + 1, decode_content=True)
+        else:
+            req = Request(url, headers={'User-Agent': USER_AGENT, 'Accept': '*/*'})
+            with urlopen(req, timeout=timeout) as resp:
+                data = resp.read(max_bytes + 1)
+        if len(data) > max_bytes:
+            data = data[:max_bytes]
+        return data.decode('utf-8', errors='ignore')
     except Exception as e:
         log(f"Fetch failed: {url} -> {e}")
         return None
@@ -277,6 +286,35 @@ def quick_protocol_probe(uri: str, host: str, port: int, timeout_ms: int = PROBE
 
 # ---------- Stage 3: V2Ray core validation (stub) ----------
 
+_CORE_TEST_URLS = (
+    'https://www.google.com/generate_204',
+    'https://cp.cloudflare.com/generate_204',
+)
+
+
+def _probe_via_http_proxy(http_port: int, deadline: float) -> bool:
+    """Fetch a generate_204 endpoint through a local core HTTP inbound before `deadline` (time.time())."""
+    import time
+    from urllib.request import build_opener, ProxyHandler
+    opener = build_opener(ProxyHandler({
+        'http': f'http://127.0.0.1:{http_port}',
+        'https': f'http://127.0.0.1:{http_port}',
+    }))
+    for url in _CORE_TEST_URLS:
+        if time.time() >= deadline:
+            break
+        try:
+            req = Request(url, headers={'User-Agent': USER_AGENT, 'Accept': '*/*'})
+            rem = max(0.5, deadline - time.time())
+            with opener.open(req, timeout=rem) as resp:
+                code = getattr(resp, 'status', None) or getattr(resp, 'code', None)
+                if isinstance(code, int) and code in (200, 204):
+                    return True
+        except Exception:
+            continue
+    return False
+
+
 def validate_with_v2ray_core(uri: str, timeout_s: int = 10) -> Optional[bool]:
     """Validate proxy by spinning up Xray and fetching via a local HTTP proxy.
 
@@ -353,49 +391,7 @@ def validate_with_v2ray_core(uri: str, timeout_s: int = 10) -> Optional[bool]:
         start = time.time()
         time.sleep(0.25)
 
-        # Prepare proxy opener
-        try:
-            from urllib.request import build_opener, ProxyHandler
-        except Exception:
-            build_opener = None
-            ProxyHandler = None
-        if build_opener is None or ProxyHandler is None:
-            # Cannot construct proxy opener; abort and cleanup
-            try:
-                proc.terminate()
-            except Exception:
-                pass
-            try:
-                os.unlink(tmp_path)
-            except Exception:
-                pass
-            return None
-
-        # Try a small set of endpoints
-        test_urls = [
-            'https://www.google.com/generate_204',
-            'https://cp.cloudflare.com/generate_204',
-        ]
-        ok = False
-        # Time budget
-        deadline = start + max(2.0, float(timeout_s))
-        for url in test_urls:
-            if time.time() >= deadline:
-                break
-            try:
-                opener = build_opener(ProxyHandler({
-                    'http': f'http://127.0.0.1:{http_port}',
-                    'https': f'http://127.0.0.1:{http_port}',
-                }))
-                req = Request(url, headers={'User-Agent': USER_AGENT, 'Accept': '*/*'})
-                rem = max(0.5, deadline - time.time())
-                with opener.open(req, timeout=rem) as resp:
-                    code = getattr(resp, 'status', None) or getattr(resp, 'code', None)
-                    if isinstance(code, int) and code in (200, 204):
-                        ok = True
-                        break
-            except Exception:
-                continue
+        ok = _probe_via_http_proxy(http_port, start + max(2.0, float(timeout_s)))
 
         # Cleanup
         try:
@@ -421,6 +417,7 @@ def validate_with_v2ray_core(uri: str, timeout_s: int = 10) -> Optional[bool]:
         return None
 
 
+
 # ------------------ Async and Batch Helpers ------------------
 import asyncio
 
@@ -645,8 +642,8 @@ def ping_host(host: str) -> bool:
 
 
 def get_country_codes_batch(hosts: List[str], timeout: int = 5, batch_size: int = 100) -> Dict[str, Optional[str]]:
-    """Resolve country codes for many hosts using ip-api.com batch endpoint.
-    Fallback to per-host _get_country_code_for_host on errors.
+    """Resolve country codes for many hosts: local GeoLite2 first, then ip-api.com batch
+    endpoint for the misses. Fallback to per-host _get_country_code_for_host on errors.
     Returns host -> country code (2 letters) or None.
     """
     result: Dict[str, Optional[str]] = {h: None for h in hosts}
@@ -692,6 +689,14 @@ def get_country_codes_batch(hosts: List[str], timeout: int = 5, batch_size: int
                 result[h] = None
         return result
 
+    # One pass over the local database; only IPs it can't place go to ip-api
+    local = get_country_codes_geoip2_batch(ips)
+    for ip, cc in local.items():
+        if cc:
+            for h in ip_to_hosts[ip]:
+                result[h] = cc
+    ips = [ip for ip in ips if not local.get(ip)]
+
     # Query in batches
     try:
         endpoint = f"http://ip-api.com/batch?fields=countryCode"
@@ -699,24 +704,30 @@ def get_country_codes_batch(hosts: List[str], timeout: int = 5, batch_size: int
         for i in range(0, len(ips), max(1, int(batch_size))):
             chunk = ips[i:i+batch_size]
             body = json.dumps([{'query': ip} for ip in chunk]).encode('utf-8')
-            req = Request(endpoint, data=body, headers=headers, method='POST')
-            with urlopen(req, timeout=timeout) as resp:
-                data = resp.read()
-                arr = json.loads(data.decode('utf-8', errors='ignore') or '[]')
-                if isinstance(arr, list):
-                    for idx, obj in enumerate(arr):
-                        try:
-                            ip = chunk[idx]
-                        except Exception:
-                            continue
-                        cc = None
-                        if isinstance(obj, dict):
-                            c = obj.get('countryCode')
-                            if isinstance(c, str) and len(c) == 2:
-                                cc = c.upper()
-                        if ip in ip_to_hosts:
-                            for h in ip_to_hosts[ip]:
-                                result[h] = cc
+            if SESSION is not None:
+                # Every chunk goes to the same endpoint: reuse one kept-alive connection
+                resp = SESSION.post(endpoint, data=body, headers=headers, timeout=timeout)
+                resp.raise_for_status()
+                data = resp.content
+            else:
+                req = Request(endpoint, data=body, headers=headers, method='POST')
+                with urlopen(req, timeout=timeout) as resp:
+                    data = resp.read()
+            arr = json.loads(data.decode('utf-8', errors='ignore') or '[]')
+            if isinstance(arr, list):
+                for idx, obj in enumerate(arr):
+                    try:
+                        ip = chunk[idx]
+                    except Exception:
+                        continue
+                    cc = None
+                    if isinstance(obj, dict):
+                        c = obj.get('countryCode')
+                        if isinstance(c, str) and len(c) == 2:
+                            cc = c.upper()
+                    if ip in ip_to_hosts:
+                        for h in ip_to_hosts[ip]:
+                            result[h] = cc
     except Exception as e:
         # Fallback to per-host
         for h in hosts:
@@ -740,6 +751,7 @@ def check_one_sync(uri: str, host: str) -> Tuple[str, str, bool]:
             except Exception:
                 p = None
             if p is not None:
+                PROBE_BUCKET.take()
                 ok2 = connect_host_port(host, int(p))
                 if ok2 and int(ENABLE_STAGE2) == 1:
                     ok2 = quick_protocol_probe(uri, host, int(p))
@@ -756,3 +768,66 @@ def check_pair(item: Tuple[str, str]) -> Tuple[str, str, bool]:
     except Exception:
         return ("", "", False)
     return check_one_sync(uri, host)
+
+
+def _ping_host_safe(host: str) -> bool:
+    try:
+        return bool(ping_host(host))
+    except Exception:
+        return False
+
+
+def ping_hosts_once(hosts: Iterable[str], workers: int = PING_WORKERS) -> Dict[str, bool]:
+    """Reachability of each distinct host, pinged once and concurrently (host -> ok).
+
+    URIs sharing a host then only need their per-port checks, not another ping.
+    """
+    unique = list(dict.fromkeys(h for h in hosts if h))
+    if not unique:
+        return {}
+    with concurrent.futures.ThreadPoolExecutor(max_workers=_io_workers(len(unique), workers)) as pool:
+        return dict(zip(unique, progress(pool.map(_ping_host_safe, unique), total=len(unique))))
+
+
+# ---------- Stage 2: asyncio checker (OPENRAY_ASYNC_STAGE2=1) ----------
+
+async def _check_one_async(uri: str, host: str, port: Optional[int], needs_tcp: bool,
+                           sem: asyncio.Semaphore, deadline_s: float = 10.0) -> Tuple[str, str, bool]:
+    """Async counterpart of check_one_sync; ping_host stays in a thread (it may shell out to ping)."""
+    from .net_async import check_port_async  # net_async builds on this module
+
+    async def _run() -> bool:
+        loop = asyncio.get_running_loop()
+        if not await loop.run_in_executor(None, ping_host, host):
+            return False
+        return await check_port_async(uri, host, port, needs_tcp)
+
+    async with sem:
+        try:
+            ok = await asyncio.wait_for(_run(), deadline_s)
+        except asyncio.TimeoutError:
+            print(f"Warning: Proxy {host} timed out after {deadline_s:g} seconds", flush=True)
+            ok = False
+        except Exception:
+            ok = False
+    return (uri, host, bool(ok))
+
+
+def check_pairs_async(items: List[Tuple[str, str, Optional[int], bool]], concurrency: int = ASYNC_STAGE2_CONCURRENCY) -> List[Tuple[str, str, bool]]:
+    """Stage 2 for many (uri, host, port, needs_tcp) items (see parsing.check_target) on a
+    single event loop; results keep input order.
+
+    Pending connects are just sockets on the loop, so concurrency can go far beyond
+    PING_WORKERS; only the ping step uses threads (PING_WORKERS of them).
+    """
+    if not items:
+        return []
+
+    async def _main() -> List[Tuple[str, str, bool]]:
+        asyncio.get_running_loop().set_default_executor(
+            concurrent.futures.ThreadPoolExecutor(max_workers=int(PING_WORKERS))
+        )
+        sem = asyncio.Semaphore(max(1, int(concurrency)))
+        return list(await asyncio.gather(*(_check_one_async(u, h, p, t, sem) for u, h, p, t in items)))
+
+    return asyncio.run(_main())
@@ -0,0 +1,80 @@
+from __future__ import annotations
+
+import asyncio
+import ssl
+from typing import Awaitable, Iterable, List, Optional, Tuple, TypeVar
+
+from .constants import ASYNC_STAGE2_CONCURRENCY, CONNECT_TIMEOUT_MS, ENABLE_STAGE2, PROBE_TIMEOUT_MS
+from .net import _idna, _is_ip_address, _is_tls_likely
+from .rate import PROBE_BUCKET
+
+T = TypeVar('T')
+
+
+async def tcp_ok(host: str, port: int, timeout: float, ssl_ctx=None, server_hostname=None) -> bool:
+    """TCP connect (plus TLS handshake when ssl_ctx is given) on the event loop; True if it completes."""
+    try:
+        _, writer = await asyncio.wait_for(
+            asyncio.open_connection(host, port, ssl=ssl_ctx, server_hostname=server_hostname),
+            timeout,
+        )
+    except Exception:
+        return False
+    writer.close()
+    try:
+        await writer.wait_closed()
+    except Exception:
+        pass
+    return True
+
+
+async def tls_handshake_ok(host_ascii: str, port: int, timeout: float) -> bool:
+    """Same handshake-only probe as net.quick_protocol_probe: certificates are not checked."""
+    ctx = ssl.create_default_context()
+    ctx.check_hostname = False
+    ctx.verify_mode = ssl.CERT_NONE
+    server_name = '' if _is_ip_address(host_ascii) else host_ascii
+    return await tcp_ok(host_ascii, port, timeout, ctx, server_name)
+
+
+async def _gather_with_sem(coros: Iterable[Awaitable[T]], limit: int) -> List[T]:
+    """gather() with at most `limit` coroutines in flight; results keep input order."""
+    sem = asyncio.Semaphore(max(1, int(limit)))
+
+    async def _one(c: Awaitable[T]) -> T:
+        async with sem:
+            return await c
+
+    return list(await asyncio.gather(*(_one(c) for c in coros)))
+
+
+async def check_port_async(uri: str, host: str, port: Optional[int], needs_tcp: bool) -> bool:
+    """Port connect and protocol probe for a host that already answered ping_host()."""
+    if not needs_tcp or port is None:
+        return True
+    if port < 1 or port > 65535:
+        return False
+    host_ascii = _idna(host)
+    wait = PROBE_BUCKET.reserve()
+    if wait > 0:
+        await asyncio.sleep(wait)
+    if not await tcp_ok(host_ascii, port, max(0.1, min(10.0, CONNECT_TIMEOUT_MS / 1000.0))):
+        return False
+    if int(ENABLE_STAGE2) != 1 or not _is_tls_likely(uri, port):
+        return True
+    return await tls_handshake_ok(host_ascii, port, max(0.1, min(10.0, PROBE_TIMEOUT_MS / 1000.0)))
+
+
+def check_ports(items: List[Tuple[str, str, Optional[int], bool]], limit: int = ASYNC_STAGE2_CONCURRENCY) -> List[bool]:
+    """check_port_async() over (uri, host, port, needs_tcp) items (see parsing.check_target)
+    on one event loop, up to `limit` connects in flight; verdicts in input order."""
+    if not items:
+        return []
+
+    async def _safe(item: Tuple[str, str, Optional[int], bool]) -> bool:
+        try:
+            return await check_port_async(*item)
+        except Exception:
+            return False
+
+    return asyncio.run(_gather_with_sem([_safe(it) for it in items], limit))
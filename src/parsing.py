@@ -1,16 +1,20 @@
 from __future__ import annotations
 
+import itertools
 import json
+import operator
 import re
 from typing import Dict, List, Optional, Tuple
 from urllib.parse import urlsplit, parse_qs, unquote, quote
 
-from .common import safe_b64decode_to_bytes
+from .common import safe_b64decode_to_bytes, sha1_bytes
 
 # Regex and schemes
 SCHEMES = [
     'vmess', 'vless', 'trojan', 'ss', 'ssr', 'hysteria', 'hysteria2', 'hy2', 'tuic', 'juicity'
 ]
+# Schemes whose Stage 2 check includes a TCP connect to the proxy port
+TCP_SCHEMES = frozenset(('vmess', 'vless', 'trojan', 'ss', 'ssr'))
 URI_REGEX = re.compile(r'(?i)\b(?:' + '|'.join(map(re.escape, SCHEMES)) + r')://[^\s<>"\']+')
 HOSTPORT_REGEX = re.compile(r'([A-Za-z0-9_.\-\[\]:]+):(\d{2,5})')
 
@@ -90,6 +94,15 @@ def extract_uris(text: str) -> List[str]:
     return uris
 
 
+def parse_and_hash(content: str, hinted_base64: bool = False) -> Tuple[List[str], List[bytes]]:
+    """Decode one fetched source and return its unique URIs with their SHA-1 digests.
+
+    Module-level and side-effect free so it can run in a worker process.
+    """
+    uris = extract_uris(maybe_decode_subscription(content, hinted_base64=hinted_base64))
+    return uris, list(map(sha1_bytes, uris))
+
+
 def _split_netloc_for_host(netloc: str) -> Optional[str]:
     # Remove userinfo if present
     if '@' in netloc:
@@ -216,6 +229,41 @@ def extract_host(uri: str) -> Optional[str]:
     return host_from_generic(uri)
 
 
+# Plain "scheme://[userinfo@]host[:port][/?#...]" lines, where urlsplit's hostname is
+# just the lowercased host. Userinfo and port are limited to printable ASCII without
+# "#/?[]" so urlsplit could not have split or rejected the netloc differently;
+# vmess/ss/ssr keep their hosts inside base64 and never match.
+_BULK_HOST_REGEX = re.compile(
+    r'^(?!(?:vmess|ssr?)://)[a-z][a-z0-9+.\-]*://'
+    r'(?:[\x21\x22\x24-\x2e\x30-\x3e\x40-\x5a\x5c\x5e-\x7e]*@)?'
+    r'([a-z0-9_.\-]+)'
+    r'(?=(?::[\x21\x22\x24-\x2e\x30-\x3e\x41-\x5a\x5c\x5e-\x7e]*)?(?:[/?#]|$))',
+    re.IGNORECASE | re.MULTILINE,
+)
+
+
+def extract_hosts_bulk(uris: List[str]) -> List[Optional[str]]:
+    """extract_host() for many URIs, aligned with the input.
+
+    One regex pass over the newline-joined list covers the common plain-host
+    lines; the rest (vmess/ss/ssr, IPv6, IDN, ...) go through extract_host().
+    """
+    hosts: List[Optional[str]] = [None] * len(uris)
+    matched = bytearray(len(uris))
+    text = '\n'.join(uris)
+    if text.count('\n') == len(uris) - 1:
+        # A match starts exactly at its line's offset: sum of earlier lengths plus newlines
+        starts = map(operator.add, itertools.accumulate(map(len, uris), initial=0), itertools.count())
+        offsets: Dict[int, int] = dict(zip(starts, range(len(uris))))
+        for m in _BULK_HOST_REGEX.finditer(text):
+            i = offsets[m.start()]
+            hosts[i] = m.group(1).lower()
+            matched[i] = 1
+    for i in [i for i, done in enumerate(matched) if not done]:
+        hosts[i] = extract_host(uris[i])
+    return hosts
+
+
 def port_from_vmess(uri: str) -> Optional[int]:
     try:
         payload_b64 = uri.split('://', 1)[1]
@@ -330,6 +378,23 @@ def extract_port(uri: str) -> Optional[int]:
     return port_from_generic(uri)
 
 
+def check_target(uri: str, host: str) -> Tuple[str, str, Optional[int], bool]:
+    """(uri, host, port, needs_tcp) for Stage 2, parsed once up front.
+
+    The port is only extracted for TCP_SCHEMES, the only ones that connect to it.
+    """
+    # find + slice: no tuple/list allocation just to read the scheme
+    i = uri.find('://')
+    needs_tcp = i > 0 and uri[:i].lower() in TCP_SCHEMES
+    port = None
+    if needs_tcp:
+        try:
+            port = extract_port(uri)
+        except Exception:
+            port = None
+    return (uri, host, port, needs_tcp)
+
+
 def is_ip_address(host: str) -> bool:
     import ipaddress
     try:
@@ -0,0 +1,44 @@
+from __future__ import annotations
+
+import threading
+import time
+
+from .constants import PROBE_RATE
+
+
+class TokenBucket:
+    """Thread-safe token bucket: at most `rate_per_sec` takes per second after an initial `burst`.
+
+    A rate of 0 disables pacing. Takers reserve their slot under the lock and
+    sleep outside it, so concurrent callers queue up evenly instead of polling.
+    """
+
+    def __init__(self, rate_per_sec: float, burst: int = 1) -> None:
+        self.rate = float(rate_per_sec)
+        self.burst = max(1, int(burst))
+        self._tokens = float(self.burst)
+        self._stamp = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self) -> float:
+        """Claim one token; returns the seconds to wait before using it (0 when available now)."""
+        if self.rate <= 0:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(float(self.burst), self._tokens + (now - self._stamp) * self.rate)
+            self._stamp = now
+            self._tokens -= 1.0
+            if self._tokens >= 0:
+                return 0.0
+            return -self._tokens / self.rate
+
+    def take(self) -> None:
+        """Block until a token is available."""
+        wait = self.reserve()
+        if wait > 0:
+            time.sleep(wait)
+
+
+# Paces Stage 2 TCP connects so large lists don't flood the socket buffers
+PROBE_BUCKET = TokenBucket(PROBE_RATE, burst=max(1, PROBE_RATE // 20))
@@ -9,6 +9,11 @@ from urllib.parse import urlsplit, parse_qs, unquote
 from .common import safe_b64decode_to_bytes, sha1_hex
 from .constants import OUTPUT_DIR
 
+try:
+    import orjson as _orjson  # type: ignore
+except Exception:
+    _orjson = None
+
 
 def _ensure_dir(path: str) -> None:
     try:
@@ -244,7 +249,8 @@ def build_trojan_config(uri: str) -> Optional[Tuple[str, Dict]]:
 
 
 def build_config_for_uri(uri: str) -> Optional[Tuple[str, Dict]]:
-    scheme = (uri.split('://', 1)[0] if '://' in uri else '').lower()
+    head, sep, _ = uri.partition('://')
+    scheme = head.lower() if sep else ''
     if scheme == 'vless':
         return build_vless_config(uri)
     if scheme == 'vmess':
@@ -276,8 +282,17 @@ def export_v2ray_configs(uris: List[str], out_dir: Optional[str] = None) -> int:
         fname = _sanitize_filename(f"{tag}.json")
         path = os.path.join(target_dir, fname)
         try:
-            with open(path, 'w', encoding='utf-8', errors='ignore') as f:
-                json.dump(cfg, f, ensure_ascii=False, indent=2)
+            blob = None
+            if _orjson is not None:
+                try:
+                    # Same bytes as json.dump(..., ensure_ascii=False, indent=2)
+                    blob = _orjson.dumps(cfg, option=_orjson.OPT_INDENT_2)
+                except Exception:
+                    blob = None
+            if blob is None:
+                blob = json.dumps(cfg, ensure_ascii=False, indent=2).encode('utf-8', errors='ignore')
+            with open(path, 'wb') as f:
+                f.write(blob)
             count += 1
         except Exception:
             # best-effort: skip failures
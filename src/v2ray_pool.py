@@ -0,0 +1,176 @@
+from __future__ import annotations
+
+import json
+import os
+import queue
+import socket
+import subprocess
+import tempfile
+import threading
+import time
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from .constants import STAGE3_BATCH, STAGE3_WORKERS, V2RAY_CORE_PATH
+from .net import _probe_via_http_proxy, validate_with_v2ray_core
+
+
+def _free_ports(n: int) -> List[int]:
+    """Reserve n distinct free loopback ports (held open together so none repeats)."""
+    socks = []
+    try:
+        for _ in range(n):
+            s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            socks.append(s)
+            s.bind(('127.0.0.1', 0))
+        return [s.getsockname()[1] for s in socks]
+    finally:
+        for s in socks:
+            try:
+                s.close()
+            except Exception:
+                pass
+
+
+class V2RayWorker:
+    """One core process serving a batch of URIs, each routed from its own local HTTP inbound.
+
+    Used as a context manager: the process starts once on enter and every URI of
+    the batch is probed through it with check(), so process startup and config
+    load are paid per batch instead of per URI.
+    """
+
+    def __init__(self, uris: List[str], core_path: Optional[str] = None) -> None:
+        self.uris = list(uris)
+        self.core_path = ((V2RAY_CORE_PATH if core_path is None else core_path) or '').strip()
+        self.ports: Dict[str, int] = {}
+        self.proc = None
+        self.tmp_path: Optional[str] = None
+
+    def _build_config(self) -> Optional[Dict]:
+        from .v2ray import build_config_for_uri  # type: ignore
+        inbounds, outbounds, rules = [], [], []
+        for i, (u, port) in enumerate(zip(self.uris, _free_ports(len(self.uris)))):
+            built = build_config_for_uri(u)
+            try:
+                ob = dict(built[1]['outbounds'][0]) if built else None
+            except Exception:
+                ob = None
+            if not ob:
+                continue
+            ob['tag'] = f'out{i}'
+            inbounds.append({'tag': f'in{i}', 'listen': '127.0.0.1', 'port': port, 'protocol': 'http', 'settings': {}})
+            outbounds.append(ob)
+            rules.append({'type': 'field', 'inboundTag': [f'in{i}'], 'outboundTag': f'out{i}'})
+            self.ports[u] = port
+        if not outbounds:
+            return None
+        return {'log': {'loglevel': 'warning'}, 'inbounds': inbounds, 'outbounds': outbounds,
+                'routing': {'rules': rules}}
+
+    def __enter__(self) -> 'V2RayWorker':
+        if not self.core_path or not os.path.exists(self.core_path):
+            return self
+        cfg = self._build_config()
+        if cfg is None:
+            return self
+        with tempfile.NamedTemporaryFile(delete=False, suffix='.json') as tmp:
+            self.tmp_path = tmp.name
+            tmp.write(json.dumps(cfg).encode('utf-8'))
+        creation = (subprocess.CREATE_NO_WINDOW if os.name == 'nt' and hasattr(subprocess, 'CREATE_NO_WINDOW') else 0)
+        self.proc = subprocess.Popen([self.core_path, '-config', self.tmp_path], stdout=subprocess.DEVNULL,
+                                     stderr=subprocess.DEVNULL, creationflags=creation)
+        # Ready once the last inbound accepts; a rejected config makes the core exit instead
+        last_port = list(self.ports.values())[-1]
+        deadline = time.time() + 3.0
+        while self.running and time.time() < deadline:
+            try:
+                socket.create_connection(('127.0.0.1', last_port), timeout=0.2).close()
+                break
+            except OSError:
+                time.sleep(0.05)
+        return self
+
+    @property
+    def running(self) -> bool:
+        return self.proc is not None and self.proc.poll() is None
+
+    def check(self, uri: str, timeout_s: int = 10) -> Optional[bool]:
+        """Same verdicts as validate_with_v2ray_core(), probed through this worker's process."""
+        port = self.ports.get(uri)
+        if port is None or not self.running:
+            return None
+        return _probe_via_http_proxy(port, time.time() + max(2.0, float(timeout_s)))
+
+    def __exit__(self, *exc) -> None:
+        if self.proc is not None:
+            try:
+                self.proc.terminate()
+                try:
+                    self.proc.wait(timeout=0.5)
+                except Exception:
+                    self.proc.kill()
+            except Exception:
+                pass
+        if self.tmp_path:
+            try:
+                os.unlink(self.tmp_path)
+            except Exception:
+                pass
+
+
+class V2RayPool:
+    """Stage 3 over many URIs with a pool of long-lived core processes.
+
+    `workers` threads pull batches of up to `batch_size` URIs from a queue and
+    probe each through one V2RayWorker, so the core starts once per batch rather
+    than once per URI. A batch whose combined config the core rejects falls back
+    to validate_with_v2ray_core() per URI.
+    """
+
+    def __init__(self, workers: int = STAGE3_WORKERS, timeout_s: int = 12, batch_size: int = STAGE3_BATCH) -> None:
+        self.workers = max(1, int(workers))
+        self.timeout_s = timeout_s
+        self.batch_size = max(1, int(batch_size))
+
+    def _run_batches(self, jobs: 'queue.Queue[List[str]]', results: 'queue.Queue[Tuple[str, bool]]') -> None:
+        while True:
+            try:
+                batch = jobs.get_nowait()
+            except queue.Empty:
+                return
+            done = 0
+            try:
+                with V2RayWorker(batch) as w:
+                    for u in batch:
+                        if not w.running:
+                            break
+                        results.put((u, w.check(u, self.timeout_s) is True))
+                        done += 1
+            except Exception:
+                pass
+            for u in batch[done:]:
+                try:
+                    ok = validate_with_v2ray_core(u, timeout_s=self.timeout_s) is True
+                except Exception:
+                    ok = False
+                results.put((u, ok))
+
+    def validate_many(self, uris: Iterable[str]) -> Iterator[Tuple[str, bool]]:
+        """(uri, validated) pairs in completion order; False also covers "core unavailable"."""
+        uris = list(uris)
+        if not uris:
+            return
+        # Small batches when there are few URIs so every worker still gets one
+        size = max(1, min(self.batch_size, -(-len(uris) // self.workers)))
+        jobs: 'queue.Queue[List[str]]' = queue.Queue()
+        for i in range(0, len(uris), size):
+            jobs.put(uris[i:i + size])
+        results: 'queue.Queue[Tuple[str, bool]]' = queue.Queue()
+        threads = [threading.Thread(target=self._run_batches, args=(jobs, results), daemon=True)
+                   for _ in range(min(self.workers, jobs.qsize()))]
+        for t in threads:
+            t.start()
+        for _ in range(len(uris)):
+            yield results.get()
+        for t in threads:
+            t.join()
@@ -0,0 +1,45 @@
+#!/usr/bin/env python3
+"""
+Tests for the lenient base64 decoding used on subscription sources.
+"""
+
+import base64
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from src.common import safe_b64decode_to_bytes  # noqa: E402
+from src.parsing import maybe_decode_subscription  # noqa: E402
+
+PLAIN = 'vless://a@b:443#x\nvless://c@d:8443#y\n'
+ENCODED = base64.b64encode(PLAIN.encode()).decode()
+
+
+class SafeB64DecodeTest(unittest.TestCase):
+    def test_ascii_whitespace_and_padding(self):
+        text = ENCODED.rstrip('=')
+        self.assertEqual(safe_b64decode_to_bytes(' ' + text[:8] + '\n' + text[8:] + '\t'), PLAIN.encode())
+
+    def test_urlsafe_alphabet(self):
+        raw = bytes(range(256))
+        self.assertEqual(safe_b64decode_to_bytes(base64.urlsafe_b64encode(raw).decode()), raw)
+
+    def test_unicode_whitespace_is_dropped(self):
+        for ws in (' ', ' ', '　'):
+            with self.subTest(ws=ws):
+                self.assertEqual(safe_b64decode_to_bytes(ENCODED + ws), PLAIN.encode())
+                self.assertEqual(safe_b64decode_to_bytes(ENCODED[:12] + ws + ENCODED[12:]), PLAIN.encode())
+
+    def test_non_ascii_text_is_rejected(self):
+        self.assertIsNone(safe_b64decode_to_bytes(ENCODED + 'é'))
+        self.assertIsNone(safe_b64decode_to_bytes(''))
+
+    def test_hinted_subscription_with_trailing_nbsp(self):
+        self.assertEqual(maybe_decode_subscription(ENCODED + ' ', hinted_base64=True), PLAIN)
+        self.assertEqual(maybe_decode_subscription(ENCODED + ' ', hinted_base64=True), PLAIN)
+
+
+if __name__ == '__main__':
+    unittest.main()
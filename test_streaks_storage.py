@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+Tests for the streaks snapshot (binary with JSON fallback) and its journal.
+"""
+
+import json
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from src import io_ops  # noqa: E402
+
+
+def _rec(streak, last_test, last_success):
+    return {'streak': streak, 'last_test': last_test, 'last_success': last_success}
+
+
+class StreaksStorageTest(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        streaks_file = os.path.join(self.test_dir, 'streaks.json')
+        for name, value in (('STATE_DIR', self.test_dir), ('STREAKS_FILE', streaks_file)):
+            patcher = mock.patch.object(io_ops, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.json_file = streaks_file
+        self.bin_file = os.path.join(self.test_dir, 'streaks.bin')
+        self.log_file = os.path.join(self.test_dir, 'streaks.log')
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def test_binary_round_trip(self):
+        streaks = {'a.example': _rec(3, 1700000000, 1700000000), 'ünï.example': _rec(0, 1700000100, 0)}
+        io_ops.save_streaks(streaks)
+        self.assertTrue(os.path.exists(self.bin_file))
+        self.assertFalse(os.path.exists(self.json_file))
+        self.assertEqual(io_ops.load_streaks(), streaks)
+
+    def test_out_of_range_value_falls_back_to_json(self):
+        io_ops.save_streaks({'a.example': _rec(1, 1, 1)})
+        self.assertTrue(os.path.exists(self.bin_file))
+        streaks = {'a.example': _rec(-1, 1, 1), 'b.example': _rec(2 ** 32, 5, 5)}
+        io_ops.save_streaks(streaks)
+        # The stale binary copy must not shadow the JSON one
+        self.assertFalse(os.path.exists(self.bin_file))
+        with open(self.json_file, 'rb') as f:
+            self.assertEqual(json.loads(f.read()), streaks)
+        self.assertEqual(io_ops.load_streaks(), streaks)
+
+    def test_journal_overrides_snapshot(self):
+        # Large enough snapshot that the journal stays below the compaction threshold
+        streaks = {f'host{i}.example': _rec(1, 100, 100) for i in range(50)}
+        io_ops.save_streaks(streaks)
+        streaks['host0.example'] = _rec(2, 200, 200)
+        streaks['new.example'] = _rec(1, 200, 200)
+        io_ops.append_streak_deltas(streaks, ['host0.example', 'new.example'])
+        self.assertTrue(os.path.exists(self.log_file))
+        loaded = io_ops.load_streaks()
+        self.assertEqual(loaded['host0.example'], _rec(2, 200, 200))
+        self.assertEqual(loaded['new.example'], _rec(1, 200, 200))
+        self.assertEqual(loaded['host1.example'], _rec(1, 100, 100))
+        # A full save folds the journal into the snapshot
+        io_ops.save_streaks(loaded)
+        self.assertFalse(os.path.exists(self.log_file))
+        self.assertEqual(io_ops.load_streaks(), loaded)
+
+    def test_torn_last_line_is_ignored(self):
+        io_ops.save_streaks({'a.example': _rec(1, 100, 100)})
+        with open(self.log_file, 'w', encoding='utf-8') as f:
+            f.write('a.example\t2\t200\t200\n')
+            f.write('b.example\t7\t20')
+        self.assertEqual(io_ops.load_streaks(), {'a.example': _rec(2, 200, 200)})
+
+
+if __name__ == '__main__':
+    unittest.main()